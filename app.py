@@ -1,15 +1,769 @@
-from flask import Flask, render_template, request, redirect, url_for, session
+import time
+_import_started = time.perf_counter()  # Module imports are the first phase of the startup timings
+
+from flask import (Flask, render_template, request, redirect, url_for, session, g, abort, has_app_context,
+                   before_render_template, template_rendered, Response, stream_with_context)
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface
 import sqlite3
+import atexit
+import csv
+import datetime
+import hashlib
+import hmac
+import io
+import itertools
+import json
+import os
+import queue
+import re
+import secrets
+import shutil
+import tempfile
+import threading
+import urllib.parse
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # No file locks (Windows): run as a single process
+    fcntl = None
+
+import pricing
+import snapshot
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
 app = Flask(__name__)
 app.secret_key = 'COP4710' #Simple key used and isn't hidden as this was made for a DB class.
 
+# Writes are appended to JOURNAL_FILE and compacted into DATA_FILE in the background,
+# either every JOURNAL_FLUSH_INTERVAL seconds or once the journal reaches JOURNAL_FLUSH_BYTES.
+app.config.update(
+    DATABASE='database.db',
+    DB_POOL_SIZE=8,
+    DB_BUSY_TIMEOUT=5000,
+    DB_SYNCHRONOUS='NORMAL',
+    DB_STATEMENT_CACHE=128,
+    DATA_FILE='sample_data.txt',
+    JOURNAL_FILE='sample_data.journal',
+    JOURNAL_FLUSH_INTERVAL=30,
+    JOURNAL_FLUSH_BYTES=256 * 1024,
+    CATALOG_PAGE_SIZE=50,
+    CATALOG_MAX_PAGE_SIZE=500,
+    LEADERBOARD_SIZE=10,
+    RECOMMENDATIONS_PER_CUSTOMER=5,
+    METRICS_TOKEN=None,
+    SLOW_QUERY_SECONDS=None,
+    SHOP_CACHE_TTL=300,
+    SHOP_CACHE_MAX_ROWS=50000,
+    CART_MAX_ITEMS=100,
+    ASGI_WORKERS=32,
+    ANALYTICS_DATABASE='database.snapshot.db',
+    ANALYTICS_MAX_STALENESS=None,
+    PASSWORD_HASH_ITERATIONS=600000,
+    PASSWORD_HASH_WORKERS=2,
+    PASSWORD_HASH_QUEUE=32,
+    LOGIN_THROTTLE={'user': (5, 60), 'ip': (20, 3)},
+    IMPORT_CHUNK_SIZE=1000,
+    SESSION_DATABASE=None,
+    CHANGE_FEED=False,
+    CHANGE_FEED_RETENTION=3600,
+    WARM_START=True,
+)
+# Any setting can be overridden from the environment as FLASK_<NAME>, e.g. FLASK_SECRET_KEY or
+# FLASK_CHANGE_FEED=true; values are parsed as JSON where possible
+app.config.from_prefixed_env()
+
+# Per-route instrumentation. Each request accumulates its SQLite time, query count, rows fetched,
+# journal sync time and template render time in g.metrics; on teardown these are added to the
+# process-wide histograms and counters served in Prometheus text format by /metrics.
+# Set SLOW_QUERY_SECONDS to log the SQL and parameters of every query slower than that.
+METRIC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+HISTOGRAMS = {
+    'request_seconds': "Wall time spent handling the request",
+    'sqlite_seconds': "Time spent executing SQLite statements and fetching rows",
+    'sync_seconds': "Time spent appending changes to the journal and updating caches",
+    'render_seconds': "Time spent rendering templates",
+}
+COUNTERS = {
+    'requests_total': "Requests handled",
+    'queries_total': "SQLite statements executed",
+    'rows_fetched_total': "Rows fetched from SQLite",
+    'shop_cache_hits_total': "Shop pages served from the per-customer cache",
+    'shop_cache_misses_total': "Shop pages queried from SQLite",
+}
+_metrics_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_startup_timings = {}  # Duration of each init_db() phase, reported as a gauge
+
+def observe(name, route, value):
+    with _metrics_lock:
+        histogram = _histograms.setdefault((name, route), [0] * len(METRIC_BUCKETS) + [0.0, 0])
+        for i, bound in enumerate(METRIC_BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+def increment(name, route, value=1):
+    with _metrics_lock:
+        _counters[(name, route)] = _counters.get((name, route), 0) + value
+
+def request_metrics():
+    return g.get('metrics') if has_app_context() else None
+
+def record_query(sql, parameters, elapsed):
+    metrics = request_metrics()
+    if metrics is not None:
+        metrics['sqlite'] += elapsed
+        metrics['queries'] += 1
+    threshold = app.config['SLOW_QUERY_SECONDS']
+    if threshold is not None and elapsed >= threshold:
+        app.logger.warning("Slow query (%.1f ms): %s %r", elapsed * 1000, ' '.join(sql.split()), parameters)
+
+def record_fetch(rows, elapsed):
+    metrics = request_metrics()
+    if metrics is not None:
+        metrics['sqlite'] += elapsed
+        metrics['rows'] += rows
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, (), time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_query(sql_script, (), time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        record_fetch(row is not None, time.perf_counter() - started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        record_fetch(len(rows), time.perf_counter() - started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        record_fetch(len(rows), time.perf_counter() - started)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        row = super().__next__()
+        record_fetch(1, time.perf_counter() - started)
+        return row
+
+# Connection.execute() and friends run statements on a cursor without calling its methods, so
+# they are sent through an instrumented cursor instead
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+@app.before_request
+def start_request_metrics():
+    g.metrics = {'started': time.perf_counter(), 'sqlite': 0.0, 'queries': 0, 'rows': 0,
+                 'sync': 0.0, 'render': 0.0}
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    metrics = g.pop('metrics', None)
+    if metrics is None:
+        return
+    route = request.endpoint or 'unknown'
+    observe('request_seconds', route, time.perf_counter() - metrics['started'])
+    observe('sqlite_seconds', route, metrics['sqlite'])
+    observe('sync_seconds', route, metrics['sync'])
+    observe('render_seconds', route, metrics['render'])
+    increment('requests_total', route)
+    increment('queries_total', route, metrics['queries'])
+    increment('rows_fetched_total', route, metrics['rows'])
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    metrics = request_metrics()
+    if metrics is not None:
+        metrics['render_started'] = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def stop_render_timer(sender, template, context, **extra):
+    metrics = request_metrics()
+    if metrics is not None and 'render_started' in metrics:
+        metrics['render'] += time.perf_counter() - metrics.pop('render_started')
+
+# Metrics in Prometheus text exposition format
+def render_metrics():
+    lines = []
+    with _metrics_lock:
+        for name, help_text in HISTOGRAMS.items():
+            lines.append(f"# HELP ecommerce_{name} {help_text}")
+            lines.append(f"# TYPE ecommerce_{name} histogram")
+            for (metric, route), histogram in sorted(_histograms.items()):
+                if metric != name:
+                    continue
+                for bound, bucket in zip(METRIC_BUCKETS, histogram):
+                    lines.append(f'ecommerce_{name}_bucket{{route="{route}",le="{bound}"}} {bucket}')
+                lines.append(f'ecommerce_{name}_bucket{{route="{route}",le="+Inf"}} {histogram[-1]}')
+                lines.append(f'ecommerce_{name}_sum{{route="{route}"}} {histogram[-2]}')
+                lines.append(f'ecommerce_{name}_count{{route="{route}"}} {histogram[-1]}')
+        lines.append("# HELP ecommerce_startup_seconds Time spent in each startup phase")
+        lines.append("# TYPE ecommerce_startup_seconds gauge")
+        for phase, seconds in _startup_timings.items():
+            lines.append(f'ecommerce_startup_seconds{{phase="{phase}"}} {seconds}')
+        for name, help_text in COUNTERS.items():
+            lines.append(f"# HELP ecommerce_{name} {help_text}")
+            lines.append(f"# TYPE ecommerce_{name} counter")
+            for (metric, route), value in sorted(_counters.items()):
+                if metric == name:
+                    lines.append(f'ecommerce_{name}{{route="{route}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+# Pooled SQLite connections are shared by every handler. DB_POOL_SIZE idle connections are
+# kept; each runs in WAL mode so readers never block the writer, waits up to DB_BUSY_TIMEOUT ms
+# for locks and caches up to DB_STATEMENT_CACHE prepared statements.
+_pool = queue.LifoQueue()
+_migrated = False
+
+def connect_db():
+    conn = sqlite3.connect(app.config['DATABASE'], check_same_thread=False,
+                           timeout=app.config['DB_BUSY_TIMEOUT'] / 1000,
+                           cached_statements=app.config['DB_STATEMENT_CACHE'],
+                           factory=InstrumentedConnection)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {app.config['DB_SYNCHRONOUS']}")
+    conn.execute(f"PRAGMA busy_timeout = {int(app.config['DB_BUSY_TIMEOUT'])}")
+    global _migrated
+    if not _migrated:
+        migrate_db(conn)
+        _migrated = True
+    return conn
+
+def acquire_db():
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        return connect_db()
+
+def release_db(conn):
+    conn.rollback()  # Never hand out a connection with a half-finished transaction
+    if _pool.qsize() < app.config['DB_POOL_SIZE']:
+        _pool.put(conn)
+    else:
+        conn.close()
+
+# Close every idle connection, e.g. after init_db() rebuilt the schema
+def drain_pool():
+    global _snapshot_taken
+    _snapshot_taken = None
+    for pool in (_pool, _read_pool):
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+# Connection for the current request; returned to the pool when the app context ends
+def get_db():
+    if 'db' not in g:
+        g.db = acquire_db()
+    return g.db
+
+@app.teardown_appcontext
+def close_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        release_db(conn)
+    conn = g.pop('read_db', None)
+    if conn is not None:
+        release_read_db(conn)
+
+# Read-only connections for the admin pages, so their long reads stay off the connections the
+# shop writes through. With ANALYTICS_MAX_STALENESS unset they open database.db with mode=ro
+# and see the latest committed data (WAL readers never block writers). With a number of seconds
+# they read ANALYTICS_DATABASE instead: a copy taken with the SQLite backup API and retaken by
+# the first admin request that finds it older than that. A request that has already written
+# reads from its primary connection, so admins always see their own changes.
+_read_pool = queue.LifoQueue()
+_snapshot_lock = threading.Lock()
+_snapshot_taken = None
+_snapshot_generation = 0
+
+def connect_read_db(path):
+    conn = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro", uri=True,
+                           check_same_thread=False, timeout=app.config['DB_BUSY_TIMEOUT'] / 1000,
+                           cached_statements=app.config['DB_STATEMENT_CACHE'],
+                           factory=InstrumentedConnection)
+    conn.execute("PRAGMA query_only = ON")
+    conn.source = (path, _snapshot_generation)
+    return conn
+
+# Copy database.db to ANALYTICS_DATABASE; connections to the previous copy are retired
+def refresh_snapshot():
+    global _snapshot_taken, _snapshot_generation
+    path = app.config['ANALYTICS_DATABASE']
+    temporary = f"{path}.{os.getpid()}.tmp"  # Worker processes refresh the copy independently
+    source = acquire_db()
+    try:
+        target = sqlite3.connect(temporary)
+        source.backup(target)
+        target.execute("PRAGMA journal_mode = DELETE")
+        target.close()
+    finally:
+        release_db(source)
+    os.replace(temporary, path)
+    _snapshot_taken = time.monotonic()
+    _snapshot_generation += 1
+
+def acquire_read_db():
+    staleness = app.config['ANALYTICS_MAX_STALENESS']
+    if staleness is None:
+        path = app.config['DATABASE']
+    else:
+        path = app.config['ANALYTICS_DATABASE']
+        if _snapshot_taken is None or time.monotonic() - _snapshot_taken > staleness:
+            with _snapshot_lock:
+                if _snapshot_taken is None or time.monotonic() - _snapshot_taken > staleness:
+                    refresh_snapshot()
+    while True:
+        try:
+            conn = _read_pool.get_nowait()
+        except queue.Empty:
+            return connect_read_db(path)
+        if conn.source == (path, _snapshot_generation):
+            return conn
+        conn.close()
+
+def release_read_db(conn):
+    conn.rollback()
+    if conn.source[1] == _snapshot_generation and _read_pool.qsize() < app.config['DB_POOL_SIZE']:
+        _read_pool.put(conn)
+    else:
+        conn.close()
+
+# Connection for the admin pages' reads in the current request
+def get_read_db():
+    if g.get('wrote'):
+        return get_db()
+    if 'read_db' not in g:
+        g.read_db = acquire_read_db()
+    return g.read_db
+
+# Purchase ledger: each Buys row carries the unit price, discount percentage and final price
+# frozen at purchase time, so history and revenue never re-join the current catalog. Rows from
+# data files written before the ledger existed are priced once from the catalog in that file, by
+# price_unpriced_purchases(). CustomerTotals keeps each customer's purchase count and spend,
+# maintained by triggers.
+def add_purchase_ledger(conn):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(Buys)")}
+    for column in ('UnitPrice', 'DiscountPercentage', 'FinalPrice'):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE Buys ADD COLUMN {column} REAL")
+    price_unpriced_purchases(conn.cursor())
+    conn.executescript('''
+        DROP INDEX IF EXISTS idx_buys_pid;
+        CREATE INDEX IF NOT EXISTS idx_buys_pid_price ON Buys(PID, FinalPrice);
+        CREATE TABLE IF NOT EXISTS CustomerTotals (
+            CID INTEGER PRIMARY KEY,
+            Purchases INTEGER NOT NULL DEFAULT 0,
+            Spent REAL NOT NULL DEFAULT 0);
+        INSERT OR REPLACE INTO CustomerTotals (CID, Purchases, Spent)
+            SELECT CID, COUNT(*), COALESCE(SUM(FinalPrice), 0) FROM Buys GROUP BY CID;
+        CREATE TRIGGER IF NOT EXISTS trg_buys_totals_insert AFTER INSERT ON Buys BEGIN
+            INSERT INTO CustomerTotals (CID, Purchases, Spent) VALUES (NEW.CID, 1, COALESCE(NEW.FinalPrice, 0))
+                ON CONFLICT (CID) DO UPDATE SET Purchases = Purchases + 1, Spent = Spent + excluded.Spent;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_buys_totals_delete AFTER DELETE ON Buys BEGIN
+            UPDATE CustomerTotals SET Purchases = Purchases - 1, Spent = Spent - COALESCE(OLD.FinalPrice, 0)
+                WHERE CID = OLD.CID;
+        END;''')
+
+# Fill in the ledger prices of Buys rows that have none from the current catalog and discounts.
+# Returns the number of rows priced.
+def price_unpriced_purchases(c):
+    c.execute('''UPDATE Buys SET
+                     UnitPrice = (SELECT Price FROM Product p WHERE p.PID = Buys.PID),
+                     DiscountPercentage = CASE WHEN DiscountApplied THEN
+                         (SELECT MAX(d.Percentage) FROM Discount d JOIN Product p ON d.Category = p.Category
+                          WHERE d.CID = Buys.CID AND p.PID = Buys.PID) END
+                 WHERE UnitPrice IS NULL''')
+    priced = c.rowcount
+    c.execute('''UPDATE Buys SET FinalPrice = UnitPrice * (1 - COALESCE(DiscountPercentage, 0) / 100.0)
+                 WHERE FinalPrice IS NULL''')
+    return max(priced, c.rowcount)
+
+# Sales rollups: each purchase records when it happened (PurchasedAt, Unix seconds) and how many
+# units were bought; FinalPrice is per unit. ProductSales, CategorySales and VendorSales hold
+# orders, units and revenue per UTC hour and day, and triggers on Buys add each purchase to its
+# buckets inside the purchase's own transaction, so reports read a few buckets instead of Buys.
+# A new purchase is credited to the category and vendors its product has at that moment. The
+# rollups aren't part of the snapshot: a cold start rebuilds them from Buys with each product's
+# category and vendors as they are then, so past sales follow a recategorized product or a
+# changed vendor. Checkout buys one unit per product, so Units equals Orders unless a data file
+# or import recorded larger quantities. Purchases without a time (from data files written
+# before this) are not in the rollups.
+SALES_ROLLUPS = {
+    # table: (key column, key type, table joined to Buys on PID for the key, key expression)
+    'ProductSales': ('PID', 'INTEGER', None, 'PID'),
+    'CategorySales': ('Category', 'TEXT', 'Product p', "COALESCE(p.Category, '')"),
+    'VendorSales': ('VID', 'INTEGER', 'Supplies s', 's.VID'),
+}
+SALES_PERIODS = "(SELECT 'hour' AS Period, 3600 AS Width UNION ALL SELECT 'day', 86400) w"
+
+def add_sales_rollups(conn):
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(Buys)")}
+    if 'PurchasedAt' not in columns:
+        conn.execute("ALTER TABLE Buys ADD COLUMN PurchasedAt INTEGER")
+    if 'Quantity' not in columns:
+        conn.execute("ALTER TABLE Buys ADD COLUMN Quantity INTEGER NOT NULL DEFAULT 1")
+    # Spend and vendor revenue are FinalPrice * Quantity from here on
+    conn.executescript('''
+        DROP TRIGGER IF EXISTS trg_buys_totals_insert;
+        DROP TRIGGER IF EXISTS trg_buys_totals_delete;
+        DELETE FROM CustomerTotals;
+        INSERT INTO CustomerTotals (CID, Purchases, Spent)
+            SELECT CID, COUNT(*), COALESCE(SUM(FinalPrice * Quantity), 0) FROM Buys GROUP BY CID;
+        CREATE TRIGGER trg_buys_totals_insert AFTER INSERT ON Buys BEGIN
+            INSERT INTO CustomerTotals (CID, Purchases, Spent)
+                VALUES (NEW.CID, 1, COALESCE(NEW.FinalPrice * NEW.Quantity, 0))
+                ON CONFLICT (CID) DO UPDATE SET Purchases = Purchases + 1, Spent = Spent + excluded.Spent;
+        END;
+        CREATE TRIGGER trg_buys_totals_delete AFTER DELETE ON Buys BEGIN
+            UPDATE CustomerTotals SET Purchases = Purchases - 1, Spent = Spent - COALESCE(OLD.FinalPrice * OLD.Quantity, 0)
+                WHERE CID = OLD.CID;
+        END;
+        DROP INDEX IF EXISTS idx_buys_pid_price;
+        CREATE INDEX IF NOT EXISTS idx_buys_pid_sales ON Buys(PID, FinalPrice, Quantity);''')
+    for table, (key, key_type, joined, expression) in SALES_ROLLUPS.items():
+        if joined is None:
+            source, new_from, new_key = "Buys b", f"{SALES_PERIODS} WHERE true", f"NEW.{key}"
+            old_match = f"{key} = OLD.{key}"
+            expression = f"b.{key}"
+        else:
+            alias = joined.split()[1]
+            source = f"Buys b JOIN {joined} ON {alias}.PID = b.PID"
+            new_from, new_key = f"{SALES_PERIODS}, {joined} WHERE {alias}.PID = NEW.PID", expression
+            old_match = f"{key} IN (SELECT {expression} FROM {joined} WHERE {alias}.PID = OLD.PID)"
+        conn.executescript(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                Period TEXT,
+                Start INTEGER,
+                {key} {key_type},
+                Orders INTEGER NOT NULL,
+                Units INTEGER NOT NULL,
+                Revenue REAL NOT NULL,
+                PRIMARY KEY (Period, Start, {key})) WITHOUT ROWID;
+            INSERT INTO {table} (Period, Start, {key}, Orders, Units, Revenue)
+                SELECT w.Period, b.PurchasedAt - b.PurchasedAt % w.Width, {expression},
+                       COUNT(*), SUM(b.Quantity), COALESCE(SUM(b.FinalPrice * b.Quantity), 0)
+                FROM {source}, {SALES_PERIODS}
+                WHERE b.PurchasedAt IS NOT NULL
+                GROUP BY 1, 2, 3;
+            CREATE TRIGGER IF NOT EXISTS trg_buys_{table.lower()}_insert AFTER INSERT ON Buys
+            WHEN NEW.PurchasedAt IS NOT NULL BEGIN
+                INSERT INTO {table} (Period, Start, {key}, Orders, Units, Revenue)
+                    SELECT w.Period, NEW.PurchasedAt - NEW.PurchasedAt % w.Width, {new_key},
+                           1, NEW.Quantity, COALESCE(NEW.FinalPrice * NEW.Quantity, 0)
+                    FROM {new_from}
+                    ON CONFLICT (Period, Start, {key}) DO UPDATE SET Orders = Orders + 1,
+                        Units = Units + excluded.Units, Revenue = Revenue + excluded.Revenue;
+            END;
+            CREATE TRIGGER IF NOT EXISTS trg_buys_{table.lower()}_delete AFTER DELETE ON Buys
+            WHEN OLD.PurchasedAt IS NOT NULL BEGIN
+                UPDATE {table} SET Orders = Orders - 1, Units = Units - OLD.Quantity,
+                    Revenue = Revenue - COALESCE(OLD.FinalPrice * OLD.Quantity, 0)
+                WHERE {old_match}
+                AND ((Period = 'hour' AND Start = OLD.PurchasedAt - OLD.PurchasedAt % 3600)
+                     OR (Period = 'day' AND Start = OLD.PurchasedAt - OLD.PurchasedAt % 86400));
+            END;''')
+
+# Schema migrations applied on top of the tables created by init_db(), in order: SQL scripts,
+# or functions taking the connection for steps that depend on the existing schema.
+# PRAGMA user_version records how many have already run against database.db.
+MIGRATIONS = [
+    # 1: Indexes for the hot joins. Discount is looked up by (CID, Category) from /shop, and
+    # Buys/Supplies are keyed (CID, PID)/(VID, PID) so PID-side joins need their own index.
+    '''CREATE INDEX IF NOT EXISTS idx_discount_cid_category ON Discount(CID, Category, Percentage);
+       CREATE INDEX IF NOT EXISTS idx_product_category ON Product(Category);
+       CREATE INDEX IF NOT EXISTS idx_buys_pid ON Buys(PID);
+       CREATE INDEX IF NOT EXISTS idx_supplies_pid ON Supplies(PID, VID);''',
+    # 2: Per-customer, per-category purchase counters for the rewards engine, kept current by
+    # triggers on Buys and Product so update_discounts() never re-aggregates purchase history.
+    '''CREATE TABLE IF NOT EXISTS CategoryPurchases (
+           CID INTEGER,
+           Category TEXT,
+           Purchases INTEGER NOT NULL DEFAULT 0,
+           PRIMARY KEY (CID, Category)) WITHOUT ROWID;
+       INSERT INTO CategoryPurchases (CID, Category, Purchases)
+           SELECT b.CID, p.Category, COUNT(*) FROM Buys b JOIN Product p ON b.PID = p.PID
+           GROUP BY b.CID, p.Category;
+       CREATE TRIGGER IF NOT EXISTS trg_buys_count_insert AFTER INSERT ON Buys BEGIN
+           INSERT INTO CategoryPurchases (CID, Category, Purchases)
+               SELECT NEW.CID, Category, 1 FROM Product WHERE PID = NEW.PID
+               ON CONFLICT (CID, Category) DO UPDATE SET Purchases = Purchases + 1;
+       END;
+       CREATE TRIGGER IF NOT EXISTS trg_buys_count_delete AFTER DELETE ON Buys BEGIN
+           UPDATE CategoryPurchases SET Purchases = Purchases - 1
+               WHERE CID = OLD.CID AND Category = (SELECT Category FROM Product WHERE PID = OLD.PID);
+       END;
+       CREATE TRIGGER IF NOT EXISTS trg_product_count_delete BEFORE DELETE ON Product BEGIN
+           UPDATE CategoryPurchases SET Purchases = Purchases - 1
+               WHERE Category = OLD.Category AND CID IN (SELECT CID FROM Buys WHERE PID = OLD.PID);
+       END;
+       CREATE TRIGGER IF NOT EXISTS trg_product_count_category AFTER UPDATE OF Category ON Product
+       WHEN OLD.Category IS NOT NEW.Category BEGIN
+           UPDATE CategoryPurchases SET Purchases = Purchases - 1
+               WHERE Category = OLD.Category AND CID IN (SELECT CID FROM Buys WHERE PID = NEW.PID);
+           INSERT INTO CategoryPurchases (CID, Category, Purchases)
+               SELECT CID, NEW.Category, 1 FROM Buys WHERE PID = NEW.PID
+               ON CONFLICT (CID, Category) DO UPDATE SET Purchases = Purchases + 1;
+       END;''',
+    # 3: Full-text indexes over product name/category and vendor name, replacing leading-wildcard
+    # LIKE scans. They index the base tables in place and are kept in sync by triggers.
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS ProductSearch USING fts5(
+           Name, Category, content='Product', content_rowid='PID', prefix='2 3');
+       CREATE VIRTUAL TABLE IF NOT EXISTS VendorSearch USING fts5(
+           Name, content='Vendor', content_rowid='VID', prefix='2 3');
+       INSERT INTO ProductSearch (ProductSearch) VALUES ('rebuild');
+       INSERT INTO VendorSearch (VendorSearch) VALUES ('rebuild');
+       CREATE TRIGGER IF NOT EXISTS trg_product_search_insert AFTER INSERT ON Product BEGIN
+           INSERT INTO ProductSearch (rowid, Name, Category) VALUES (NEW.PID, NEW.Name, NEW.Category);
+       END;
+       CREATE TRIGGER IF NOT EXISTS trg_product_search_delete AFTER DELETE ON Product BEGIN
+           INSERT INTO ProductSearch (ProductSearch, rowid, Name, Category)
+               VALUES ('delete', OLD.PID, OLD.Name, OLD.Category);
+       END;
+       CREATE TRIGGER IF NOT EXISTS trg_product_search_update AFTER UPDATE OF Name, Category ON Product BEGIN
+           INSERT INTO ProductSearch (ProductSearch, rowid, Name, Category)
+               VALUES ('delete', OLD.PID, OLD.Name, OLD.Category);
+           INSERT INTO ProductSearch (rowid, Name, Category) VALUES (NEW.PID, NEW.Name, NEW.Category);
+       END;
+       CREATE TRIGGER IF NOT EXISTS trg_vendor_search_insert AFTER INSERT ON Vendor BEGIN
+           INSERT INTO VendorSearch (rowid, Name) VALUES (NEW.VID, NEW.Name);
+       END;
+       CREATE TRIGGER IF NOT EXISTS trg_vendor_search_delete AFTER DELETE ON Vendor BEGIN
+           INSERT INTO VendorSearch (VendorSearch, rowid, Name) VALUES ('delete', OLD.VID, OLD.Name);
+       END;
+       CREATE TRIGGER IF NOT EXISTS trg_vendor_search_update AFTER UPDATE OF Name ON Vendor BEGIN
+           INSERT INTO VendorSearch (VendorSearch, rowid, Name) VALUES ('delete', OLD.VID, OLD.Name);
+           INSERT INTO VendorSearch (rowid, Name) VALUES (NEW.VID, NEW.Name);
+       END;''',
+    # 4: Precomputed product recommendations, rebuilt in batch by refresh_recommendations()
+    '''CREATE TABLE IF NOT EXISTS Recommendation (
+           CID INTEGER,
+           Rank INTEGER,
+           PID INTEGER,
+           Category TEXT,
+           PurchaseCount INTEGER,
+           PRIMARY KEY (CID, Rank)) WITHOUT ROWID;''',
+    # 5: Purchase ledger columns on Buys and per-customer totals
+    add_purchase_ledger,
+    # 6: Best discount percentage per customer and category, used by pricing.price_many(). Kept
+    # current by triggers on Discount, so a category resolves to exactly one discount.
+    '''CREATE TABLE IF NOT EXISTS CategoryDiscount (
+           CID INTEGER,
+           Category TEXT,
+           Percentage REAL NOT NULL,
+           PRIMARY KEY (CID, Category)) WITHOUT ROWID;
+       INSERT OR REPLACE INTO CategoryDiscount (CID, Category, Percentage)
+           SELECT CID, Category, MAX(Percentage) FROM Discount
+           WHERE CID IS NOT NULL AND Category IS NOT NULL AND Percentage IS NOT NULL
+           GROUP BY CID, Category;
+       CREATE TRIGGER IF NOT EXISTS trg_discount_best_insert AFTER INSERT ON Discount
+       WHEN NEW.CID IS NOT NULL AND NEW.Category IS NOT NULL AND NEW.Percentage IS NOT NULL BEGIN
+           INSERT INTO CategoryDiscount (CID, Category, Percentage) VALUES (NEW.CID, NEW.Category, NEW.Percentage)
+               ON CONFLICT (CID, Category) DO UPDATE SET Percentage = MAX(Percentage, excluded.Percentage);
+       END;
+       CREATE TRIGGER IF NOT EXISTS trg_discount_best_delete AFTER DELETE ON Discount
+       WHEN OLD.CID IS NOT NULL AND OLD.Category IS NOT NULL BEGIN
+           DELETE FROM CategoryDiscount WHERE CID = OLD.CID AND Category = OLD.Category;
+           INSERT INTO CategoryDiscount (CID, Category, Percentage)
+               SELECT CID, Category, MAX(Percentage) FROM Discount
+               WHERE CID = OLD.CID AND Category = OLD.Category AND Percentage IS NOT NULL
+               GROUP BY CID, Category;
+       END;
+       CREATE TRIGGER IF NOT EXISTS trg_discount_best_update AFTER UPDATE OF Percentage, CID, Category ON Discount BEGIN
+           DELETE FROM CategoryDiscount
+               WHERE (CID = OLD.CID AND Category = OLD.Category) OR (CID = NEW.CID AND Category = NEW.Category);
+           INSERT INTO CategoryDiscount (CID, Category, Percentage)
+               SELECT CID, Category, MAX(Percentage) FROM Discount
+               WHERE ((CID = OLD.CID AND Category = OLD.Category) OR (CID = NEW.CID AND Category = NEW.Category))
+               AND Percentage IS NOT NULL
+               GROUP BY CID, Category;
+       END;''',
+    # 7: Cross-process change feed, read by receive_changes() when CHANGE_FEED is on
+    '''CREATE TABLE IF NOT EXISTS ChangeFeed (
+           Seq INTEGER PRIMARY KEY AUTOINCREMENT,
+           Process INTEGER,
+           Created REAL,
+           Entries TEXT);
+       CREATE INDEX IF NOT EXISTS idx_changefeed_created ON ChangeFeed(Created);''',
+    # 8: Purchase time and quantity on Buys, and hourly/daily sales rollups
+    add_sales_rollups,
+]
+
+# Bulk-load statements for each sample_data.txt section, used with executemany() by init_db()
+LOAD_STATEMENTS = {
+    'PRODUCTS': "INSERT INTO Product (PID, Price, Name, Category) VALUES (?, ?, ?, ?)",
+    'CUSTOMERS': "INSERT INTO Customer (CID, Name) VALUES (?, ?)",
+    'VENDORS': "INSERT INTO Vendor (VID, Name) VALUES (?, ?)",
+    'BUYS': "INSERT INTO Buys (CID, PID, DiscountApplied, UnitPrice, DiscountPercentage, FinalPrice, PurchasedAt, Quantity) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+    'SUPPLIES': "INSERT INTO Supplies (VID, PID) VALUES (?, ?)",
+    'DISCOUNTS': "INSERT INTO Discount (Percentage, Type, CID, Category) VALUES (?, ?, ?, ?)",
+    'USERS': "INSERT INTO Users (Username, Password, UserType, CID) VALUES (?, ?, ?, ?)",
+}
+LOAD_BATCH_SIZE = 10000
+
+# Reward tiers: (percentage, total purchases needed). The Nth tier goes to the customer's Nth
+# most-purchased category, provided they bought at least REWARD_CATEGORY_MINIMUM items in it.
+REWARD_TIERS = [(15.0, 5), (10.0, 10), (5.0, 20)]
+REWARD_CATEGORY_MINIMUM = 5
+
+def migrate_db(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        if isinstance(script, str):
+            conn.executescript(script)
+        else:
+            script(conn)
+        conn.execute(f"PRAGMA user_version = {number}")
+    conn.commit()
+
+# Base tables created by init_db(); everything else is built on top of them by MIGRATIONS.
+# A database whose tables were created from different statements is never reused by a warm start.
+TABLES = (
+    '''CREATE TABLE Product (
+       PID INTEGER PRIMARY KEY AUTOINCREMENT,
+       Price REAL,
+       Name TEXT,
+       Category TEXT)''',
+    '''CREATE TABLE Customer (
+       CID INTEGER PRIMARY KEY AUTOINCREMENT,
+       Name TEXT)''',
+    '''CREATE TABLE Vendor (
+       VID INTEGER PRIMARY KEY AUTOINCREMENT,
+       Name TEXT)''',
+    '''CREATE TABLE Discount (
+       DID INTEGER PRIMARY KEY AUTOINCREMENT,
+       Percentage REAL,
+       Type TEXT,
+       CID INTEGER,
+       Category TEXT,
+       FOREIGN KEY (CID) REFERENCES Customer(CID))''',
+    '''CREATE TABLE Buys (
+       CID INTEGER,
+       PID INTEGER,
+       DiscountApplied INTEGER DEFAULT 0,
+       UnitPrice REAL,
+       DiscountPercentage REAL,
+       FinalPrice REAL,
+       PurchasedAt INTEGER,
+       Quantity INTEGER NOT NULL DEFAULT 1,
+       PRIMARY KEY (CID, PID),
+       FOREIGN KEY (CID) REFERENCES Customer(CID),
+       FOREIGN KEY (PID) REFERENCES Product(PID))''',
+    '''CREATE TABLE Supplies (
+       VID INTEGER,
+       PID INTEGER,
+       PRIMARY KEY (VID, PID),
+       FOREIGN KEY (VID) REFERENCES Vendor(VID),
+       FOREIGN KEY (PID) REFERENCES Product(PID))''',
+    '''CREATE TABLE Users (
+       UID INTEGER PRIMARY KEY AUTOINCREMENT,
+       Username TEXT UNIQUE,
+       Password TEXT,
+       UserType TEXT,
+       CID INTEGER,
+       FOREIGN KEY (CID) REFERENCES Customer(CID))''',
+)
+SCHEMA_FINGERPRINT = hashlib.sha256('\n'.join(TABLES).encode('utf-8')).hexdigest()[:16]
+
+# Tables written to a binary snapshot, in load order
+SNAPSHOT_TABLES = ('Product', 'Customer', 'Vendor', 'Discount', 'Buys', 'Supplies', 'Users')
+
+# Primary key columns of each table, used when replaying journal entries
+TABLE_KEYS = {
+    'Product': ('PID',),
+    'Customer': ('CID',),
+    'Vendor': ('VID',),
+    'Discount': ('DID',),
+    'Buys': ('CID', 'PID'),
+    'Supplies': ('VID', 'PID'),
+    'Users': ('UID',),
+}
+
 # Initialize SQLite3 database and populate with data from sample_data.txt
-def init_db():
-    conn = sqlite3.connect('database.db')
+def init_db(warm=False):
+    global _migrated, _feed_seq, _startup_timings
+    _migrated = True  # Migrations run below, after the tables are rebuilt
+    _feed_seq = None
+    drain_pool()
+    timings = {'imports': IMPORT_SECONDS}
+    
+    # Warm start: database.db was built from this exact snapshot with these tables, and every
+    # journaled change was committed to it before being journaled, so it is reused as it is
+    started = time.perf_counter()
+    checksum = file_checksum(app.config['DATA_FILE'])
+    reuse = warm and database_matches(checksum)
+    timings['check'] = time.perf_counter() - started
+    if reuse:
+        started = time.perf_counter()
+        conn = connect_db()
+        migrate_db(conn)
+        conn.close()
+        timings['index'] = time.perf_counter() - started
+        started = time.perf_counter()
+        compact_journal()
+        timings['compact'] = time.perf_counter() - started
+        _startup_timings = timings
+        app.logger.info("Reused database.db (%s)", format_timings(timings))
+        return {'warm': True, 'rows': 0, 'load_seconds': 0.0, 'rows_per_second': 0,
+                'index_seconds': timings['index'], 'timings': timings}
+    
+    # A binary snapshot is checked before anything is dropped, so a damaged one leaves the
+    # database as it was
+    started = time.perf_counter()
+    snap = None
+    if snapshot.is_snapshot_path(app.config['DATA_FILE']):
+        snap = open_snapshot(app.config['DATA_FILE'])
+    conn = connect_db()
+    conn.execute("PRAGMA synchronous = OFF")  # The database is rebuilt from the snapshot after a crash
     c = conn.cursor()
     
     # Drop existing tables
+    c.execute('DROP TABLE IF EXISTS Meta')
+    c.execute('DROP TABLE IF EXISTS ProductSearch')
+    c.execute('DROP TABLE IF EXISTS VendorSearch')
     c.execute('DROP TABLE IF EXISTS Product')
     c.execute('DROP TABLE IF EXISTS Customer')
     c.execute('DROP TABLE IF EXISTS Vendor')
@@ -17,118 +771,221 @@ def init_db():
     c.execute('DROP TABLE IF EXISTS Buys')
     c.execute('DROP TABLE IF EXISTS Supplies')
     c.execute('DROP TABLE IF EXISTS Users')
+    c.execute('DROP TABLE IF EXISTS CategoryPurchases')
+    c.execute('DROP TABLE IF EXISTS Recommendation')
+    c.execute('DROP TABLE IF EXISTS CustomerTotals')
+    c.execute('DROP TABLE IF EXISTS CategoryDiscount')
+    c.execute('DROP TABLE IF EXISTS ChangeFeed')
+    for table in SALES_ROLLUPS:
+        c.execute(f'DROP TABLE IF EXISTS {table}')
     
     # Create tables
-    c.execute('''CREATE TABLE Product (
-        PID INTEGER PRIMARY KEY AUTOINCREMENT,
-        Price REAL,
-        Name TEXT,
-        Category TEXT)''')
-    
-    c.execute('''CREATE TABLE Customer (
-        CID INTEGER PRIMARY KEY AUTOINCREMENT,
-        Name TEXT)''')
-    
-    c.execute('''CREATE TABLE Vendor (
-        VID INTEGER PRIMARY KEY AUTOINCREMENT,
-        Name TEXT)''')
-    
-    c.execute('''CREATE TABLE Discount (
-        DID INTEGER PRIMARY KEY AUTOINCREMENT,
-        Percentage REAL,
-        Type TEXT,
-        CID INTEGER,
-        Category TEXT,
-        FOREIGN KEY (CID) REFERENCES Customer(CID))''')
-    
-    c.execute('''CREATE TABLE Buys (
-        CID INTEGER,
-        PID INTEGER,
-        DiscountApplied INTEGER DEFAULT 0,
-        PRIMARY KEY (CID, PID),
-        FOREIGN KEY (CID) REFERENCES Customer(CID),
-        FOREIGN KEY (PID) REFERENCES Product(PID))''')
-    
-    c.execute('''CREATE TABLE Supplies (
-        VID INTEGER,
-        PID INTEGER,
-        PRIMARY KEY (VID, PID),
-        FOREIGN KEY (VID) REFERENCES Vendor(VID),
-        FOREIGN KEY (PID) REFERENCES Product(PID))''')
-    
-    c.execute('''CREATE TABLE Users (
-        UID INTEGER PRIMARY KEY AUTOINCREMENT,
-        Username TEXT UNIQUE,
-        Password TEXT,
-        UserType TEXT,
-        CID INTEGER,
-        FOREIGN KEY (CID) REFERENCES Customer(CID))''')
-    
-    # Load data from sample_data.txt
+    for statement in TABLES:
+        c.execute(statement)
+    
+    # Indexes are built by migrate_db() once the data is loaded
+    c.execute("PRAGMA user_version = 0")
+    timings['schema'] = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    if snap is not None:
+        rows, has_users = load_snapshot(c, snap)
+    else:
+        rows, has_users = load_sample_data(c, app.config['DATA_FILE'])
+    
+    # Add default admin only if no users exist in sample_data.txt
+    if not has_users:
+        c.execute("INSERT INTO Users (Username, Password, UserType, CID) VALUES (?, ?, ?, NULL)",
+                 ("admin", "admin123", "Admin"))
+    
+    # Purchases from a data file written before the ledger are priced from the catalog in that
+    # file, before journaled price changes are replayed over it; the snapshot is rewritten below
+    # so their prices never depend on the catalog again
+    unpriced = price_unpriced_purchases(c)
+    
+    # Apply changes made since the last compaction, then fold them into the snapshot
+    journal = app.config['JOURNAL_FILE']
+    for path in (journal + '.compacting', journal):
+        replay_journal(c, path)
+    
+    conn.commit()
+    load_seconds = timings['load'] = time.perf_counter() - started
+    
+    # Indexes and derived tables are built in one pass now that the data is in place
+    started = time.perf_counter()
+    migrate_db(conn)
+    index_seconds = timings['index'] = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    conn.close()
+    compact_journal()
+    if unpriced and claim_snapshot_writer():
+        sync_to_file()
+    conn = acquire_db()
+    record_snapshot(conn)
+    release_db(conn)
+    timings['compact'] = time.perf_counter() - started
+    _startup_timings = timings
+    
+    rate = rows / load_seconds if load_seconds else 0
+    app.logger.info("Loaded %d rows in %.2fs (%.0f rows/sec), built indexes in %.2fs (%s)",
+                    rows, load_seconds, rate, index_seconds, format_timings(timings))
+    return {'warm': False, 'rows': rows, 'load_seconds': load_seconds, 'rows_per_second': rate,
+            'index_seconds': index_seconds, 'timings': timings}
+
+def format_timings(timings):
+    return ', '.join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in timings.items())
+
+# CRC32 and size of a snapshot file, or None if it doesn't exist
+def file_checksum(path):
+    if not os.path.exists(path):
+        return None
+    checksum = 0
+    with open(path, 'rb') as f:
+        while block := f.read(1 << 20):
+            checksum = zlib.crc32(block, checksum)
+    return f"{os.path.getsize(path)}:{checksum:08x}"
+
+# Record which snapshot database.db matches; called whenever one side is rebuilt from the other
+def record_snapshot(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS Meta (Key TEXT PRIMARY KEY, Value TEXT)")
+    conn.executemany("INSERT OR REPLACE INTO Meta (Key, Value) VALUES (?, ?)",
+                     [('schema', SCHEMA_FINGERPRINT), ('snapshot', file_checksum(app.config['DATA_FILE']))])
+    conn.commit()
+
+def database_matches(checksum):
+    if checksum is None or not os.path.exists(app.config['DATABASE']):
+        return False
+    conn = sqlite3.connect(app.config['DATABASE'])
+    try:
+        meta = dict(conn.execute("SELECT Key, Value FROM Meta"))
+    except sqlite3.Error:
+        return False
+    finally:
+        conn.close()
+    return meta.get('schema') == SCHEMA_FINGERPRINT and meta.get('snapshot') == checksum
+
+# Load a sample_data.txt-format file in batches. Keys are assigned here in file order, exactly as
+# AUTOINCREMENT would, so customer names resolve to CIDs without querying the table.
+# Returns the number of rows loaded and whether the file had a USERS section.
+def load_sample_data(c, path):
+    rows = 0
     customer_name_to_cid = {}
-    with open('sample_data.txt', 'r') as f:
-        section = None
+    has_users = False
+    next_id = {'PRODUCTS': 0, 'CUSTOMERS': 0, 'VENDORS': 0}
+    batch = []
+    section = None
+    for line_section, data in read_sample_data(path):
+        if line_section != section or len(batch) >= LOAD_BATCH_SIZE:
+            if batch:
+                c.executemany(LOAD_STATEMENTS[section], batch)
+                rows += len(batch)
+                batch = []
+            section = line_section
+            has_users = has_users or section == 'USERS'
+        if data is None:
+            continue
+        if section in next_id:
+            next_id[section] += 1
+        if section == 'PRODUCTS':
+            price, name, category = data.split(',')
+            batch.append((next_id[section], float(price), name.strip(), category.strip()))
+        elif section == 'CUSTOMERS':
+            name = data.strip()
+            customer_name_to_cid.setdefault(name, next_id[section])
+            batch.append((next_id[section], name))
+        elif section == 'VENDORS':
+            batch.append((next_id[section], data.strip()))
+        elif section == 'BUYS':
+            # cid,pid[,discount_applied[,unit_price,discount_percentage,final_price[,purchased_at,quantity]]];
+            # files without the prices are priced from the catalog by init_db()
+            parts = data.split(',') + [''] * 6
+            discount_applied = int(parts[2]) if parts[2] else 0
+            unit_price, percentage, final_price = (float(part) if part.strip() else None for part in parts[3:6])
+            purchased_at = int(parts[6]) if parts[6].strip() else None
+            quantity = int(parts[7]) if parts[7].strip() else 1
+            batch.append((int(parts[0]), int(parts[1]), discount_applied, unit_price, percentage, final_price,
+                          purchased_at, quantity))
+        elif section == 'SUPPLIES':
+            vid, pid = map(int, data.split(','))
+            batch.append((vid, pid))
+        elif section == 'DISCOUNTS':
+            percentage, type_, cid, category = data.split(',')
+            batch.append((float(percentage), type_.strip(), int(cid), category.strip()))
+        elif section == 'USERS':
+            username, password, user_type, cid_or_name = data.split(',')
+            cid = customer_name_to_cid.get(cid_or_name.strip()) if cid_or_name != 'NULL' else None
+            batch.append((username.strip(), password.strip(), user_type.strip(), cid))
+    if batch:
+        c.executemany(LOAD_STATEMENTS[section], batch)
+        rows += len(batch)
+    return rows, has_users
+
+# Open a binary snapshot (snapshot.py) and check it against the CRC32 in its header
+def open_snapshot(path):
+    snap = snapshot.Snapshot(path)
+    if not snap.verify():
+        snap.close()
+        raise ValueError(f"{path} is corrupt: its contents don't match the checksum in its header")
+    return snap
+
+# Bulk-load an open snapshot and close it. Keys are stored in the snapshot and loaded as they
+# are; columns the current schema doesn't have are skipped. Returns the number of rows loaded and
+# whether the snapshot had any users.
+def load_snapshot(c, snap):
+    rows = 0
+    with snap:
+        for table in SNAPSHOT_TABLES:
+            if table not in snap.tables:
+                continue
+            c.execute(f"PRAGMA table_info({table})")
+            existing = {row[1] for row in c.fetchall()}
+            columns = [name for name in snap.columns(table) if name in existing]
+            c.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                          snap.rows(table, columns))
+            rows += snap.tables[table]['rows']
+        return rows, snap.tables.get('Users', {}).get('rows', 0) > 0
+
+# Stream (section, data) pairs from a sample_data.txt-format file. A (section, None) pair marks
+# the start of each section so callers can tell an empty section from a missing one.
+def read_sample_data(path):
+    section = None
+    with open(path, 'r') as f:
         for line in f:
             line = line.strip()
             if not line or line.startswith('#'):
                 continue
-            if line in ['PRODUCTS', 'CUSTOMERS', 'VENDORS', 'BUYS', 'SUPPLIES', 'DISCOUNTS', 'USERS']:
+            if line in LOAD_STATEMENTS:
                 section = line
+                yield section, None
                 continue
             data = line.split('#')[0].strip()
-            if not data:
-                continue
-            if section == 'PRODUCTS':
-                price, name, category = data.split(',')
-                c.execute("INSERT INTO Product (Price, Name, Category) VALUES (?, ?, ?)", 
-                         (float(price), name.strip(), category.strip()))
-            elif section == 'CUSTOMERS':
-                name = data
-                c.execute("INSERT INTO Customer (Name) VALUES (?)", (name.strip(),))
-                c.execute("SELECT last_insert_rowid()")
-                cid = c.fetchone()[0]
-                customer_name_to_cid[name.strip()] = cid
-            elif section == 'VENDORS':
-                name = data
-                c.execute("INSERT INTO Vendor (Name) VALUES (?)", (name.strip(),))
-            elif section == 'BUYS':
-                parts = data.split(',')
-                cid = int(parts[0])
-                pid = int(parts[1])
-                discount_applied = int(parts[2]) if len(parts) > 2 else 0
-                c.execute("INSERT INTO Buys (CID, PID, DiscountApplied) VALUES (?, ?, ?)", (cid, pid, discount_applied))
-            elif section == 'SUPPLIES':
-                vid, pid = map(int, data.split(','))
-                c.execute("INSERT INTO Supplies (VID, PID) VALUES (?, ?)", (vid, pid))
-            elif section == 'DISCOUNTS':
-                percentage, type_, cid, category = data.split(',')
-                c.execute("INSERT INTO Discount (Percentage, Type, CID, Category) VALUES (?, ?, ?, ?)",
-                         (float(percentage), type_.strip(), int(cid), category.strip()))
-            elif section == 'USERS':
-                username, password, user_type, cid_or_name = data.split(',')
-                cid = None
-                if cid_or_name != 'NULL':
-                    c.execute("SELECT CID FROM Customer WHERE Name = ?", (cid_or_name.strip(),))
-                    result = c.fetchone()
-                    cid = result[0] if result else None
-                c.execute("INSERT INTO Users (Username, Password, UserType, CID) VALUES (?, ?, ?, ?)",
-                         (username.strip(), password.strip(), user_type.strip(), cid))
-    
-    # Add default admin only if no users exist in sample_data.txt
-    with open('sample_data.txt', 'r') as f:
-        if 'USERS' not in f.read():
-            c.execute("INSERT INTO Users (Username, Password, UserType, CID) VALUES (?, ?, ?, NULL)",
-                     ("admin", "admin123", "Admin"))
-    
-    conn.commit()
-    conn.close()
+            if data and section:
+                yield section, data
 
-# Sync database state to sample_data.txt
+# Sync database state to sample_data.txt, or to a binary snapshot if DATA_FILE ends in .snap
 def sync_to_file():
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
+    conn = acquire_db()
     
-    with open('sample_data.txt', 'w') as f:
+    # Write to a temporary file first so a crash never leaves a half-written snapshot. Every
+    # table is read in one transaction, so the snapshot is of a single moment even while
+    # requests keep committing.
+    path = app.config['DATA_FILE']
+    try:
+        conn.execute("BEGIN")
+        if snapshot.is_snapshot_path(path):
+            snapshot.write_snapshot(conn, path + '.tmp', SNAPSHOT_TABLES)
+        else:
+            write_sample_data(conn.cursor(), path + '.tmp')
+        conn.commit()
+        os.replace(path + '.tmp', path)
+        record_snapshot(conn)
+    finally:
+        release_db(conn)
+
+# Write the tables to path in sample_data.txt format
+def write_sample_data(c, path):
+    with open(path, 'w') as f:
         f.write("# Sample data for e-commerce database\n")
         
         f.write("\nPRODUCTS\n")
@@ -147,9 +1004,10 @@ def sync_to_file():
             f.write(f"{name[0]}\n")
         
         f.write("\nBUYS\n")
-        c.execute("SELECT CID, PID, DiscountApplied FROM Buys ORDER BY CID, PID")
-        for cid, pid, discount_applied in c.fetchall():
-            f.write(f"{cid},{pid},{discount_applied}\n")
+        c.execute('''SELECT CID, PID, DiscountApplied, UnitPrice, DiscountPercentage, FinalPrice, PurchasedAt, Quantity
+                     FROM Buys ORDER BY CID, PID''')
+        for row in c.fetchall():
+            f.write(",".join('' if value is None else str(value) for value in row) + "\n")
         
         f.write("\nSUPPLIES\n")
         c.execute("SELECT VID, PID FROM Supplies ORDER BY VID, PID")
@@ -167,8 +1025,414 @@ def sync_to_file():
         for username, password, user_type, cid, name in c.fetchall():
             cid_str = name if cid is not None else 'NULL'
             f.write(f"{username},{password},{user_type},{cid_str}\n")
-    
-    conn.close()
+
+# Record a row changed by the current request; written to the journal by sync_changes().
+# op is 'insert' (full row), 'update' (key + set) or 'delete' (where).
+def record_change(op, table, row=None, key=None, values=None, where=None):
+    entry = {'op': op, 'table': table}
+    if op == 'insert':
+        entry['row'] = row
+    elif op == 'update':
+        entry['key'] = key
+        entry['set'] = values
+    else:
+        entry['where'] = where
+    g.setdefault('changes', []).append(entry)
+
+# Append the changes recorded during this request to the journal in a single write, then let
+# the caches registered with @on_change react to them
+def sync_changes():
+    changes = g.pop('changes', [])
+    if changes:
+        g.wrote = True
+        started = time.perf_counter()
+        append_journal(changes)
+        if app.config['CHANGE_FEED']:
+            publish_changes(changes)
+        for listener in change_listeners:
+            listener(changes)
+        metrics = request_metrics()
+        if metrics is not None:
+            metrics['sync'] += time.perf_counter() - started
+
+# Listeners get a list of journal entries. An entry without its table's key fields (e.g. a
+# 'reset' entry after missed cross-process changes) may have touched any row of that table.
+# Entries from other worker processes carry remote=True.
+change_listeners = []
+
+def on_change(func):
+    change_listeners.append(func)
+    return func
+
+_journal_lock = threading.Lock()
+_compact_lock = threading.Lock()
+_compact_requested = threading.Event()
+
+# Each batch is one O_APPEND write, so appends from several worker processes never interleave
+def append_journal(entries):
+    data = ''.join(json.dumps(entry) + '\n' for entry in entries).encode('utf-8')
+    with _journal_lock:
+        fd = os.open(app.config['JOURNAL_FILE'], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+    if size >= app.config['JOURNAL_FLUSH_BYTES']:
+        _compact_requested.set()
+
+# Re-apply journal entries on top of a freshly loaded snapshot. Every entry is
+# idempotent, so entries already reflected in the snapshot can be replayed safely.
+def replay_journal(c, path):
+    if not os.path.exists(path):
+        return
+    columns = {}
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break  # Torn final write from a crash; everything before it is intact
+            table = entry['table']
+            if table not in TABLE_KEYS:
+                continue
+            if table not in columns:
+                c.execute(f"PRAGMA table_info({table})")
+                columns[table] = {row[1] for row in c.fetchall()}
+            fields = entry.get('row') or entry.get('set') or entry.get('where') or {}
+            if not set(fields) | set(entry.get('key') or {}) <= columns[table]:
+                continue
+            if entry['op'] == 'insert':
+                row = entry['row']
+                c.execute(f"INSERT OR REPLACE INTO {table} ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                          list(row.values()))
+            elif entry['op'] == 'update':
+                assignments = ', '.join(f"{col} = ?" for col in entry['set'])
+                conditions = ' AND '.join(f"{col} = ?" for col in entry['key'])
+                c.execute(f"UPDATE {table} SET {assignments} WHERE {conditions}",
+                          list(entry['set'].values()) + list(entry['key'].values()))
+            elif entry['op'] == 'delete':
+                conditions = ' AND '.join(f"{col} = ?" for col in entry['where'])
+                c.execute(f"DELETE FROM {table} WHERE {conditions}", list(entry['where'].values()))
+
+# Fold the journal into the snapshot. The journal is rotated aside first so requests
+# can keep appending while sync_to_file() rewrites sample_data.txt. Only the snapshot writer
+# process compacts; the snapshot is written from database.db, which every worker shares.
+def compact_journal():
+    if not claim_snapshot_writer():
+        return
+    journal = app.config['JOURNAL_FILE']
+    compacting = journal + '.compacting'
+    with _compact_lock:
+        with _journal_lock:
+            if not os.path.exists(compacting):
+                if not os.path.exists(journal) or os.path.getsize(journal) == 0:
+                    return
+                os.replace(journal, compacting)
+        sync_to_file()
+        os.remove(compacting)
+
+def _journal_flusher():
+    while True:
+        _compact_requested.wait(app.config['JOURNAL_FLUSH_INTERVAL'])
+        _compact_requested.clear()
+        try:
+            compact_journal()
+            prune_change_feed()
+        except Exception:
+            app.logger.exception("Journal compaction failed")
+
+# Start the background compaction thread; pending changes are also compacted on exit
+def start_journal_flusher():
+    threading.Thread(target=_journal_flusher, name='journal-flusher', daemon=True).start()
+    atexit.register(compact_journal)
+
+# Several worker processes can serve the same database.db (e.g. `uvicorn asgi:application
+# --workers 4`); they coordinate through file locks:
+#   - DATABASE.lock: every serving process holds it shared. A process that starts while no
+#     other one holds it rebuilds database.db with init_db(); later ones reuse it as it is.
+#   - DATABASE.init.lock: held exclusively while a process starts, so startups take turns. flock
+#     can't turn an exclusive lock into a shared one atomically; without this, a process starting
+#     while the rebuilding one switches over could find DATABASE.lock free and rebuild again.
+#   - DATA_FILE.lock: held exclusively by the one process that writes the snapshot. Every
+#     process appends to the journal, but only this one compacts it. When it exits, another
+#     process's flusher claims the lock on its next pass.
+# Without fcntl every process acts alone, as with a single process.
+_process_locks = {}
+
+# Take (or convert) this process's lock on path; returns False if wait is off and it's taken
+def lock_file(path, shared=False, wait=False):
+    if fcntl is None:
+        return True
+    if path not in _process_locks:
+        _process_locks[path] = open(path, 'a')
+    try:
+        fcntl.flock(_process_locks[path], (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if wait else fcntl.LOCK_NB))
+    except BlockingIOError:
+        return False
+    return True
+
+def unlock_file(path):
+    if fcntl is not None and path in _process_locks:
+        fcntl.flock(_process_locks[path], fcntl.LOCK_UN)
+
+def claim_snapshot_writer():
+    return lock_file(app.config['DATA_FILE'] + '.lock')
+
+# Get this process ready to serve: rebuild database.db (or reuse it, with WARM_START) unless
+# other processes are already serving it, and start the journal flusher. Returns init_db()'s load stats, or None if the
+# database was reused.
+def start_worker():
+    path = app.config['DATABASE'] + '.lock'
+    init_path = app.config['DATABASE'] + '.init.lock'
+    stats = None
+    # Waits while another process is still starting
+    lock_file(init_path, wait=True)
+    try:
+        if lock_file(path):
+            stats = init_db(warm=app.config['WARM_START'])
+        lock_file(path, shared=True, wait=True)
+    finally:
+        unlock_file(init_path)
+    claim_snapshot_writer()
+    start_journal_flusher()
+    return stats
+
+# Cross-process cache invalidation. With CHANGE_FEED on, every batch of changes a process
+# commits is also added to the ChangeFeed table. Each process reads the entries added since its
+# last look at the start of every request and passes other processes' changes to its @on_change
+# listeners, so per-process caches never serve data changed by another worker. The snapshot
+# writer deletes entries older than CHANGE_FEED_RETENTION seconds; a process that finds it has
+# missed entries resets every cache.
+_feed_seq = None
+_feed_lock = threading.Lock()
+
+def publish_changes(changes):
+    conn = get_db()
+    conn.execute("INSERT INTO ChangeFeed (Process, Created, Entries) VALUES (?, ?, ?)",
+                 (os.getpid(), time.time(), json.dumps(changes)))
+    conn.commit()
+
+@app.before_request
+def receive_changes():
+    global _feed_seq
+    if not app.config['CHANGE_FEED']:
+        return
+    c = get_db().cursor()
+    with _feed_lock:
+        if _feed_seq is None:
+            c.execute("SELECT COALESCE(MAX(Seq), 0) FROM ChangeFeed")
+            _feed_seq = c.fetchone()[0]
+            return
+        c.execute("SELECT Seq, Process, Entries FROM ChangeFeed WHERE Seq > ? ORDER BY Seq", (_feed_seq,))
+        rows = c.fetchall()
+        if not rows:
+            return
+        changes = []
+        if rows[0][0] > _feed_seq + 1:
+            changes = [{'op': 'reset', 'table': table, 'remote': True} for table in TABLE_KEYS]
+        for seq, process, entries in rows:
+            if process != os.getpid():
+                changes.extend(dict(entry, remote=True) for entry in json.loads(entries))
+        _feed_seq = rows[-1][0]
+    if changes:
+        for listener in change_listeners:
+            listener(changes)
+
+def prune_change_feed():
+    if not app.config['CHANGE_FEED'] or not claim_snapshot_writer():
+        return
+    conn = acquire_db()
+    try:
+        conn.execute("DELETE FROM ChangeFeed WHERE Created < ?",
+                     (time.time() - app.config['CHANGE_FEED_RETENTION'],))
+        conn.commit()
+    finally:
+        release_db(conn)
+
+# Server-side sessions. With SESSION_DATABASE set, session data lives in that SQLite file and the
+# cookie only carries a random session ID, so every worker process sees the same sessions and
+# logging out ends the session everywhere. The ID is replaced whenever the logged-in user changes.
+# With SESSION_DATABASE unset, Flask's signed cookie sessions are used.
+_session_pool = queue.LifoQueue()
+_sessions_purged = 0.0
+
+class ServerSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.uid = self.get('uid')
+
+def connect_session_db():
+    conn = sqlite3.connect(app.config['SESSION_DATABASE'], check_same_thread=False,
+                           timeout=app.config['DB_BUSY_TIMEOUT'] / 1000)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute('''CREATE TABLE IF NOT EXISTS Sessions (
+                        SID TEXT PRIMARY KEY,
+                        Data TEXT,
+                        Expires REAL) WITHOUT ROWID''')
+    return conn
+
+def session_query(sql, params):
+    try:
+        conn = _session_pool.get_nowait()
+    except queue.Empty:
+        conn = connect_session_db()
+    try:
+        with conn:
+            return conn.execute(sql, params).fetchone()
+    finally:
+        if _session_pool.qsize() < app.config['DB_POOL_SIZE']:
+            _session_pool.put(conn)
+        else:
+            conn.close()
+
+# Delete expired sessions, at most once an hour
+def purge_sessions():
+    global _sessions_purged
+    if time.time() - _sessions_purged > 3600:
+        _sessions_purged = time.time()
+        session_query("DELETE FROM Sessions WHERE Expires <= ?", (_sessions_purged,))
+
+class SessionStore(SecureCookieSessionInterface):
+    def open_session(self, app, request):
+        if app.config['SESSION_DATABASE'] is None:
+            return super().open_session(app, request)
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            row = session_query("SELECT Data FROM Sessions WHERE SID = ? AND Expires > ?", (sid, time.time()))
+            if row:
+                return ServerSession(self.serializer.loads(row[0]), sid)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        if app.config['SESSION_DATABASE'] is None:
+            return super().save_session(app, session, response)
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session:
+            if session.modified and session.sid:
+                session_query("DELETE FROM Sessions WHERE SID = ?", (session.sid,))
+                response.delete_cookie(name, domain=domain, path=path, secure=secure, samesite=samesite,
+                                       httponly=httponly)
+            return
+        if not self.should_set_cookie(app, session) and session.sid:
+            return
+        if session.sid is None or session.get('uid') != session.uid:
+            if session.sid:
+                session_query("DELETE FROM Sessions WHERE SID = ?", (session.sid,))
+            session.sid = secrets.token_urlsafe(32)
+        expires = self.get_expiration_time(app, session)
+        stored_until = expires.timestamp() if expires else time.time() + app.permanent_session_lifetime.total_seconds()
+        session_query("INSERT OR REPLACE INTO Sessions (SID, Data, Expires) VALUES (?, ?, ?)",
+                      (session.sid, self.serializer.dumps(dict(session)), stored_until))
+        purge_sessions()
+        response.set_cookie(name, session.sid, expires=expires, httponly=httponly, domain=domain, path=path,
+                            secure=secure, samesite=samesite)
+
+app.session_interface = SessionStore()
+
+# Passwords are stored as PBKDF2-SHA256 hashes: 'pbkdf2_sha256$<iterations>$<salt>$<hash>'.
+# Rows still holding a plaintext password (e.g. loaded from an old sample_data.txt) are hashed
+# on the user's next successful login, as are hashes made with fewer iterations than
+# PASSWORD_HASH_ITERATIONS. Hashing runs on a pool of PASSWORD_HASH_WORKERS threads (hashlib
+# releases the GIL while hashing); at most PASSWORD_HASH_QUEUE more jobs may wait for it, and
+# logins beyond that are turned away, so a burst of logins can't tie up every request thread.
+PASSWORD_SCHEME = 'pbkdf2_sha256'
+_hash_executor = None
+_hash_slots = None
+_hash_executor_lock = threading.Lock()
+
+def hash_password(password):
+    iterations = app.config['PASSWORD_HASH_ITERATIONS']
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f"{PASSWORD_SCHEME}${iterations}${salt.hex()}${digest.hex()}"
+
+# Returns (matches, needs_rehash). A malformed hash matches no password; the first one found is
+# logged.
+_malformed_hash_logged = False
+
+def check_password(stored, password):
+    global _malformed_hash_logged
+    if not stored.startswith(PASSWORD_SCHEME + '$'):
+        return hmac.compare_digest(stored.encode(), password.encode()), True
+    try:
+        _, iterations, salt, digest = stored.split('$')
+        iterations = int(iterations)
+        candidate = hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), iterations)
+    except ValueError:
+        if not _malformed_hash_logged:
+            _malformed_hash_logged = True
+            app.logger.warning("Malformed password hash in Users; logins against it fail")
+        return False, False
+    return hmac.compare_digest(candidate.hex(), digest), iterations != app.config['PASSWORD_HASH_ITERATIONS']
+
+# Compared against when the username doesn't exist, so unknown users take as long as known ones:
+# a well-formed hash with a random digest, which checking costs one PBKDF2 run like any other
+# hash but which no password matches. Building it hashes nothing.
+def dummy_password_hash():
+    iterations = app.config['PASSWORD_HASH_ITERATIONS']
+    return f"{PASSWORD_SCHEME}${iterations}${os.urandom(16).hex()}${os.urandom(32).hex()}"
+
+# Run func(*args) on the hashing pool and wait for it; returns None if the pool is saturated
+def password_job(func, *args):
+    global _hash_executor, _hash_slots
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            workers = app.config['PASSWORD_HASH_WORKERS']
+            _hash_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            _hash_slots = threading.BoundedSemaphore(workers + app.config['PASSWORD_HASH_QUEUE'])
+    if not _hash_slots.acquire(blocking=False):
+        return None
+    try:
+        return _hash_executor.submit(func, *args).result()
+    finally:
+        _hash_slots.release()
+
+# Token buckets limiting failed logins per username and per client IP. LOGIN_THROTTLE maps each
+# key kind to (burst, seconds to regain one attempt). A login is refused while either bucket is
+# empty; only failed attempts take a token, so users who type their password right never wait.
+_login_buckets = {}
+_login_buckets_lock = threading.Lock()
+
+def login_buckets(username):
+    return [(kind, key) for kind, key in (('user', username), ('ip', request.remote_addr))
+            if kind in app.config['LOGIN_THROTTLE']]
+
+# Refill and return the bucket for key; callers hold _login_buckets_lock
+def refill_bucket(kind, key, now):
+    burst, seconds = app.config['LOGIN_THROTTLE'][kind]
+    tokens, updated = _login_buckets.get((kind, key), (burst, now))
+    tokens = min(burst, tokens + (now - updated) / seconds)
+    _login_buckets[(kind, key)] = (tokens, now)
+    return tokens
+
+def login_allowed(username):
+    now = time.monotonic()
+    with _login_buckets_lock:
+        return all(refill_bucket(kind, key, now) >= 1 for kind, key in login_buckets(username))
+
+def record_login_failure(username):
+    now = time.monotonic()
+    with _login_buckets_lock:
+        for kind, key in login_buckets(username):
+            _login_buckets[(kind, key)] = (refill_bucket(kind, key, now) - 1, now)
+        if len(_login_buckets) > 10000:
+            # Forget buckets that have refilled completely
+            for (kind, key), (tokens, updated) in list(_login_buckets.items()):
+                if refill_bucket(kind, key, now) >= app.config['LOGIN_THROTTLE'][kind][0]:
+                    del _login_buckets[(kind, key)]
 
 # Login page
 @app.route('/', methods=['GET', 'POST'])
@@ -177,12 +1441,25 @@ def login():
         if 'login' in request.form:
             username = request.form['username']
             password = request.form['password']
-            conn = sqlite3.connect('database.db')
+            if not login_allowed(username):
+                return render_template('login.html', error="Too many failed attempts. Try again later."), 429
+            conn = get_db()
             c = conn.cursor()
-            c.execute("SELECT UID, UserType, CID FROM Users WHERE Username = ? AND Password = ?", (username, password))
+            c.execute("SELECT UID, UserType, CID, Password FROM Users WHERE Username = ?", (username,))
             user = c.fetchone()
-            conn.close()
-            if user:
+            stored = (user[3] or '') if user else dummy_password_hash()
+            result = password_job(check_password, stored, password)
+            if result is None:
+                return render_template('login.html', error="Too many logins in progress. Try again shortly."), 503
+            matches, needs_rehash = result
+            if user and matches:
+                if needs_rehash:
+                    password_hash = password_job(hash_password, password)
+                    if password_hash is not None:
+                        c.execute("UPDATE Users SET Password = ? WHERE UID = ?", (password_hash, user[0]))
+                        record_change('update', 'Users', key={'UID': user[0]}, values={'Password': password_hash})
+                        conn.commit()
+                        sync_changes()
                 session['uid'] = user[0]
                 session['user_type'] = user[1]
                 session['cid'] = user[2]
@@ -191,13 +1468,17 @@ def login():
                 else:
                     return redirect(url_for('shop'))
             else:
+                record_login_failure(username)
                 return render_template('login.html', error="Invalid credentials")
         elif 'register' in request.form:
             username = request.form['username']
             password = request.form['password']
             user_type = request.form['user_type']
             name = request.form.get('name', '')
-            conn = sqlite3.connect('database.db')
+            password = password_job(hash_password, password)
+            if password is None:
+                return render_template('login.html', error="Too many logins in progress. Try again shortly."), 503
+            conn = get_db()
             c = conn.cursor()
             try:
                 if user_type == 'Customer' and name:
@@ -209,19 +1490,21 @@ def login():
                         c.execute("INSERT INTO Customer (Name) VALUES (?)", (name,))
                         c.execute("SELECT last_insert_rowid()")
                         cid = c.fetchone()[0]
+                        record_change('insert', 'Customer', {'CID': cid, 'Name': name})
                     c.execute("INSERT INTO Users (Username, Password, UserType, CID) VALUES (?, ?, ?, ?)",
                              (username, password, user_type, cid))
                 else:
+                    cid = None
                     c.execute("INSERT INTO Users (Username, Password, UserType, CID) VALUES (?, ?, ?, NULL)",
                              (username, password, user_type))
+                record_change('insert', 'Users', {'UID': c.lastrowid, 'Username': username, 'Password': password,
+                                                  'UserType': user_type, 'CID': cid})
                 conn.commit()
-                sync_to_file()
+                sync_changes()
                 return render_template('login.html', message="Account created! Please log in.")
             except sqlite3.IntegrityError:
-                conn.close()
+                conn.rollback()
                 return render_template('login.html', error="Username already exists")
-            finally:
-                conn.close()
     return render_template('login.html')
 
 # Customer shopping page
@@ -230,80 +1513,275 @@ def shop():
     if 'uid' not in session or session['user_type'] != 'Customer':
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
     
     if request.method == 'POST' and 'buy' in request.form:
+        purchase(session['cid'], [int(request.form['pid'])])
+    elif request.method == 'POST' and 'add_to_cart' in request.form:
         pid = int(request.form['pid'])
-        cid = session['cid']
-        c.execute('''SELECT d.Percentage 
-                     FROM Discount d 
-                     JOIN Product p ON p.Category = d.Category 
-                     WHERE d.CID = ? AND p.PID = ?''', (cid, pid))
-        discount = c.fetchone()
-        discount_applied = 1 if discount else 0
-        c.execute("INSERT OR IGNORE INTO Buys (CID, PID, DiscountApplied) VALUES (?, ?, ?)", 
-                  (cid, pid, discount_applied))
-        conn.commit()
-        sync_to_file()
-        # Update discounts after purchase
+        cart = session.get('cart', [])
+        if pid not in cart and len(cart) < app.config['CART_MAX_ITEMS']:
+            session['cart'] = cart + [pid]
+    
+    cid = session['cid']
+    clauses, params, limit, filters = catalog_query()
+    after = request.args.get('after', 0, type=int)
+    page_key = (after, tuple(sorted(filters.items())))
+    customer_name, page, generation = shop_cache_get(cid, page_key)
+    if page is None:
+        clauses.insert(0, 'p.PID > ?')
+        params.insert(0, after)
+        c.execute(f'''SELECT p.PID, p.Name, p.Category
+                      FROM Product p
+                      WHERE {' AND '.join(clauses)}
+                      AND NOT EXISTS (SELECT 1 FROM Buys b WHERE b.CID = ? AND b.PID = p.PID)
+                      ORDER BY p.PID
+                      LIMIT ?''', 
+                      params + [cid, limit + 1])
+        rows, last = paginate(c.fetchall(), limit)
+        next_after = last[0] if last else None
+        prices = pricing.price_many(c, cid, [row[0] for row in rows])
+        products = []
+        for pid, name, category in rows:
+            price, percentage, discounted_price = prices[pid]
+            products.append((pid, price, name, category, percentage, discounted_price))
+        
+        if customer_name is None:
+            c.execute("SELECT Name FROM Customer WHERE CID = ?", (cid,))
+            customer_name = c.fetchone()[0]
+        page = (products, next_after)
+        shop_cache_put(cid, customer_name, page_key, page, generation)
+    products, next_after = page
+    
+    recommendations = customer_recommendations(c, cid)
+    
+    return render_template('shop.html', products=products, customer_name=customer_name,
+                           filters=filters, next_after=next_after, recommendations=recommendations,
+                           cart_size=len(session.get('cart', [])))
+
+# Buy every product in pids the customer doesn't own yet in one transaction: all of them are
+# priced with one price_many() call, the rows are inserted with one executemany, and the rewards
+# recompute and journal sync run once. Returns the number of products bought.
+def purchase(cid, pids):
+    conn = get_db()
+    c = conn.cursor()
+    
+    c.execute(f"SELECT PID FROM Buys WHERE CID = ? AND PID IN ({', '.join('?' * len(pids))})", [cid] + list(pids))
+    owned = {row[0] for row in c.fetchall()}
+    
+    # The price and discount are frozen into the ledger row as they are now; the sales rollups
+    # are updated by triggers in this same transaction
+    prices = pricing.price_many(c, cid, [pid for pid in pids if pid not in owned])
+    purchased_at = int(time.time())
+    rows = [(cid, pid, 1 if percentage else 0, price, percentage, final_price, purchased_at, 1)
+            for pid, (price, percentage, final_price) in sorted(prices.items())]
+    c.executemany('''INSERT OR IGNORE INTO Buys (CID, PID, DiscountApplied, UnitPrice, DiscountPercentage, FinalPrice,
+                                             PurchasedAt, Quantity)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+    for _, pid, discount_applied, price, percentage, final_price, purchased_at, quantity in rows:
+        record_change('insert', 'Buys', {'CID': cid, 'PID': pid, 'DiscountApplied': discount_applied,
+                                         'UnitPrice': price, 'DiscountPercentage': percentage,
+                                         'FinalPrice': final_price, 'PurchasedAt': purchased_at,
+                                         'Quantity': quantity})
+    conn.commit()
+    
+    # Update discounts after purchase
+    if rows:
         update_discounts(cid)
+    sync_changes()
+    return len(rows)
+
+# Customer cart, kept in the session as a list of PIDs and bought in one checkout
+@app.route('/cart', methods=['GET', 'POST'])
+def cart():
+    if 'uid' not in session or session['user_type'] != 'Customer':
+        return redirect(url_for('login'))
+    
+    cid = session['cid']
+    message = None
     
-    c.execute('''SELECT p.PID, p.Price, p.Name, p.Category, d.Percentage
-                 FROM Product p
-                 LEFT JOIN Discount d ON p.Category = d.Category AND d.CID = ?
-                 WHERE p.PID NOT IN (SELECT PID FROM Buys WHERE CID = ?)''', 
-                 (session['cid'], session['cid']))
-    products = []
-    for pid, price, name, category, percentage in c.fetchall():
-        discounted_price = price * (1 - percentage / 100) if percentage else price
-        products.append((pid, price, name, category, percentage, discounted_price))
+    if request.method == 'POST':
+        if 'remove' in request.form:
+            pid = int(request.form['pid'])
+            session['cart'] = [item for item in session.get('cart', []) if item != pid]
+        elif 'checkout' in request.form and session.get('cart'):
+            count = purchase(cid, session['cart'])
+            session['cart'] = []
+            message = f"Checked out {count} item{'s' if count != 1 else ''}."
     
-    c.execute("SELECT Name FROM Customer WHERE CID = ?", (session['cid'],))
-    customer_name = c.fetchone()[0]
+    items = []
+    total = 0.0
+    pids = session.get('cart', [])
+    if pids:
+        c = get_db().cursor()
+        c.execute(f"SELECT PID, Name, Category FROM Product WHERE PID IN ({', '.join('?' * len(pids))}) ORDER BY PID",
+                  pids)
+        rows = c.fetchall()
+        prices = pricing.price_many(c, cid, pids)
+        for pid, name, category in rows:
+            price, percentage, discounted_price = prices[pid]
+            items.append((pid, name, category, price, percentage, discounted_price))
+            total += discounted_price
     
-    conn.close()
-    return render_template('shop.html', products=products, customer_name=customer_name)
+    return render_template('cart.html', items=items, total=total, message=message)
+
+# Per-customer cache of /shop product pages and the customer's name; the recommendations shown
+# with them are read on every view, since the batch job may refresh them from another process.
+# Entries are kept in LRU order, expire SHOP_CACHE_TTL seconds after they were created, and the
+# least recently used customers are evicted once more than SHOP_CACHE_MAX_ROWS products are
+# cached in total.
+# Pages are keyed by their cursor and filters; each covers the PIDs after its cursor up to the
+# next page's cursor. Every invalidation bumps _shop_cache_generation, and a page queried while
+# an invalidation happened is not stored, so a slow reader can't cache data a writer just changed.
+_shop_cache = OrderedDict()
+_shop_cache_rows = 0
+_shop_cache_generation = 0
+_shop_cache_lock = threading.Lock()
+
+# Returns (customer name, page, generation); name and page are None when not cached
+def shop_cache_get(cid, page_key):
+    with _shop_cache_lock:
+        entry = _shop_cache.get(cid)
+        if entry is not None and entry['expires'] < time.monotonic():
+            drop_shop_cache_entry(cid)
+            entry = None
+        page = entry['pages'].get(page_key) if entry else None
+        if entry is not None:
+            _shop_cache.move_to_end(cid)
+        increment('shop_cache_hits_total' if page else 'shop_cache_misses_total', 'shop')
+        return (entry['name'] if entry else None), page, _shop_cache_generation
+
+def shop_cache_put(cid, name, page_key, page, generation):
+    global _shop_cache_rows
+    with _shop_cache_lock:
+        if generation != _shop_cache_generation:
+            return
+        entry = _shop_cache.get(cid)
+        if entry is None:
+            entry = _shop_cache[cid] = {'name': name, 'pages': {}, 'rows': 0,
+                                        'expires': time.monotonic() + app.config['SHOP_CACHE_TTL']}
+        _shop_cache.move_to_end(cid)
+        entry['pages'][page_key] = page
+        entry['rows'] += len(page[0])
+        _shop_cache_rows += len(page[0])
+        while _shop_cache_rows > app.config['SHOP_CACHE_MAX_ROWS'] and len(_shop_cache) > 1:
+            drop_shop_cache_entry(next(iter(_shop_cache)))
+
+# Callers hold _shop_cache_lock
+def drop_shop_cache_entry(cid):
+    global _shop_cache_rows
+    entry = _shop_cache.pop(cid, None)
+    if entry is not None:
+        _shop_cache_rows -= entry['rows']
+
+# Purchases and discount changes drop that customer's pages; product changes drop only the
+# pages whose PID range holds the product, for every customer. Discount deletes made from the
+# admin page only carry the DID, so they clear the whole cache.
+@on_change
+def invalidate_shop_cache(changes):
+    global _shop_cache_rows, _shop_cache_generation
+    with _shop_cache_lock:
+        for change in changes:
+            fields = change.get('row') or change.get('where') or change.get('key') or {}
+            if change['table'] in ('Buys', 'Discount', 'Customer'):
+                if 'CID' not in fields:
+                    _shop_cache.clear()
+                    _shop_cache_rows = 0
+                elif fields['CID'] is not None:
+                    drop_shop_cache_entry(fields['CID'])
+            elif change['table'] == 'Product' and 'PID' not in fields:
+                _shop_cache.clear()
+                _shop_cache_rows = 0
+            elif change['table'] == 'Product':
+                pid = fields['PID']
+                for entry in _shop_cache.values():
+                    for (after, filters), (products, next_after) in list(entry['pages'].items()):
+                        if after < pid and (next_after is None or pid <= next_after):
+                            del entry['pages'][(after, filters)]
+                            entry['rows'] -= len(products)
+                            _shop_cache_rows -= len(products)
+            else:
+                continue
+            _shop_cache_generation += 1
+
+# Filters and page size for the catalog pages: optional category and price filters plus
+# ?limit=N. Returns the conditions on Product p with their parameters, the page size, and the
+# filters to carry over into the next page link. Callers add their own keyset cursor.
+def catalog_query():
+    clauses = []
+    params = []
+    filters = {}
+    category = request.args.get('category', '').strip()
+    if category:
+        clauses.append('p.Category = ?')
+        params.append(category)
+        filters['category'] = category
+    for arg, operator in (('min_price', '>='), ('max_price', '<=')):
+        value = request.args.get(arg, type=float)
+        if value is not None:
+            clauses.append(f'p.Price {operator} ?')
+            params.append(value)
+            filters[arg] = value
+    limit = request.args.get('limit', app.config['CATALOG_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['CATALOG_MAX_PAGE_SIZE']))
+    if limit != app.config['CATALOG_PAGE_SIZE']:
+        filters['limit'] = limit
+    return clauses, params, limit, filters
+
+# Trim rows fetched for limit + 1 products (grouped by PID, possibly several rows per product)
+# to one page. Returns the page and its last row to continue after, or None on the last page.
+def paginate(rows, limit):
+    page = []
+    count = 0
+    for row in rows:
+        if not page or page[-1][0] != row[0]:
+            count += 1
+            if count > limit:
+                return page, page[-1]
+        page.append(row)
+    return page, None
+
+# Turn free text into an FTS5 query that prefix-matches every word, e.g. 'lap ele' -> '"lap"* "ele"*'
+def fts_query(text):
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', text))
 
 # Update discounts based on purchase history
 def update_discounts(cid):
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
     
-    # Get purchase counts per category
-    c.execute('''SELECT p.Category, COUNT(b.PID) as purchase_count
-                 FROM Buys b
-                 JOIN Product p ON b.PID = p.PID
-                 WHERE b.CID = ?
-                 GROUP BY p.Category
-                 ORDER BY purchase_count DESC''', (cid,))
+    # Purchase counts per category, maintained incrementally by the CategoryPurchases triggers
+    c.execute('''SELECT Category, Purchases
+                 FROM CategoryPurchases
+                 WHERE CID = ? AND Purchases > 0
+                 ORDER BY Purchases DESC, Category''', (cid,))
     category_counts = c.fetchall()
+    total_purchases = sum(count for _, count in category_counts)
+    
+    # Determine which category each unlocked tier belongs to
+    wanted = {}
+    for rank, (percentage, min_total) in enumerate(REWARD_TIERS):
+        if total_purchases >= min_total and rank < len(category_counts) \
+                and category_counts[rank][1] >= REWARD_CATEGORY_MINIMUM:
+            wanted[category_counts[rank][0]] = percentage
+    
+    # Only touch the Discount rows whose tier actually changed
+    c.execute("SELECT DID, Category, Percentage FROM Discount WHERE CID = ? AND Type = 'Rewards'", (cid,))
+    for did, category, percentage in c.fetchall():
+        if wanted.get(category) == percentage:
+            del wanted[category]
+        else:
+            c.execute("DELETE FROM Discount WHERE DID = ?", (did,))
+            record_change('delete', 'Discount', where={'DID': did, 'CID': cid})
     
-    # Get total purchases
-    c.execute("SELECT COUNT(*) FROM Buys WHERE CID = ?", (cid,))
-    total_purchases = c.fetchone()[0]
-    
-    # Determine unlocked discount tiers
-    discounts_unlocked = []
-    if total_purchases >= 5:  # Unlock 15% for top category
-        discounts_unlocked.append((15.0, 0))  # (percentage, min_purchases)
-    if total_purchases >= 10:  # 2x 5 for 10% discount
-        discounts_unlocked.append((10.0, 1))
-    if total_purchases >= 20:  # 2x 10 for 5% discount
-        discounts_unlocked.append((5.0, 2))
-    
-    # Clear existing discounts for this customer
-    c.execute("DELETE FROM Discount WHERE CID = ? AND Type = 'Rewards'", (cid,))
-    
-    # Assign discounts to top categories
-    for i, (percentage, min_rank) in enumerate(discounts_unlocked):
-        if i < len(category_counts) and category_counts[i][1] >= 5:  # At least 5 purchases in category
-            category = category_counts[i][0]
-            c.execute("INSERT INTO Discount (Percentage, Type, CID, Category) VALUES (?, 'Rewards', ?, ?)",
-                     (percentage, cid, category))
+    for category, percentage in wanted.items():
+        c.execute("INSERT INTO Discount (Percentage, Type, CID, Category) VALUES (?, 'Rewards', ?, ?)",
+                 (percentage, cid, category))
+        record_change('insert', 'Discount', {'DID': c.lastrowid, 'Percentage': percentage, 'Type': 'Rewards',
+                                             'CID': cid, 'Category': category})
     
     conn.commit()
-    conn.close()
 
 # Logout route
 @app.route('/logout')
@@ -317,7 +1795,7 @@ def products():
     if 'uid' not in session or session['user_type'] != 'Admin':
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
     
     if request.method == 'POST':
@@ -326,32 +1804,60 @@ def products():
             name = request.form['name']
             category = request.form['category']
             c.execute("INSERT INTO Product (Price, Name, Category) VALUES (?, ?, ?)", (price, name, category))
+            record_change('insert', 'Product', {'PID': c.lastrowid, 'Price': price, 'Name': name, 'Category': category})
         elif 'delete' in request.form:
             pid = int(request.form['pid'])
             c.execute("DELETE FROM Product WHERE PID = ?", (pid,))
+            record_change('delete', 'Product', where={'PID': pid})
         elif 'update' in request.form:
             pid = int(request.form['pid'])
             price = float(request.form['price'])
             c.execute("UPDATE Product SET Price = ? WHERE PID = ?", (price, pid))
+            record_change('update', 'Product', key={'PID': pid}, values={'Price': price})
         conn.commit()
-        sync_to_file()
+        sync_changes()
     
+    c = get_read_db().cursor()
+    clauses, params, limit, filters = catalog_query()
     search = request.args.get('search', '')
-    if search:
-        c.execute('''SELECT p.PID, p.Price, p.Name, p.Category, v.Name AS VendorName
-                     FROM Product p
-                     LEFT JOIN Supplies s ON p.PID = s.PID
-                     LEFT JOIN Vendor v ON s.VID = v.VID
-                     WHERE p.Name LIKE ? OR p.Category LIKE ?''', (f'%{search}%', f'%{search}%'))
+    match = fts_query(search)
+    next_rank = None
+    if match:
+        # Best matches first; the cursor is the (rank, PID) of the last product shown
+        filters['search'] = search
+        after_rank = request.args.get('after_rank', type=float)
+        if after_rank is not None:
+            clauses.append('(ps.rank > ? OR (ps.rank = ? AND p.PID > ?))')
+            params += [after_rank, after_rank, request.args.get('after', 0, type=int)]
+        c.execute(f'''SELECT p.PID, p.Price, p.Name, p.Category, v.Name AS VendorName, p.Rank
+                      FROM (SELECT p.PID, p.Price, p.Name, p.Category, ps.rank AS Rank
+                            FROM ProductSearch ps
+                            JOIN Product p ON p.PID = ps.rowid
+                            WHERE {' AND '.join(['ProductSearch MATCH ?'] + clauses)}
+                            ORDER BY ps.rank, p.PID
+                            LIMIT ?) p
+                      LEFT JOIN Supplies s ON p.PID = s.PID
+                      LEFT JOIN Vendor v ON s.VID = v.VID
+                      ORDER BY p.Rank, p.PID''', [match] + params + [limit + 1])
+        products, last = paginate(c.fetchall(), limit)
+        next_rank = last[5] if last else None
     else:
-        c.execute('''SELECT p.PID, p.Price, p.Name, p.Category, v.Name AS VendorName
-                     FROM Product p
-                     LEFT JOIN Supplies s ON p.PID = s.PID
-                     LEFT JOIN Vendor v ON s.VID = v.VID''')
-    products = c.fetchall()
+        clauses.insert(0, 'p.PID > ?')
+        params.insert(0, request.args.get('after', 0, type=int))
+        c.execute(f'''SELECT p.PID, p.Price, p.Name, p.Category, v.Name AS VendorName
+                      FROM (SELECT p.PID, p.Price, p.Name, p.Category
+                            FROM Product p
+                            WHERE {' AND '.join(clauses)}
+                            ORDER BY p.PID
+                            LIMIT ?) p
+                      LEFT JOIN Supplies s ON p.PID = s.PID
+                      LEFT JOIN Vendor v ON s.VID = v.VID
+                      ORDER BY p.PID''', params + [limit + 1])
+        products, last = paginate(c.fetchall(), limit)
+    next_after = last[0] if last else None
     
-    conn.close()
-    return render_template('products.html', products=products)
+    return render_template('products.html', products=products, filters=filters,
+                           next_after=next_after, next_rank=next_rank)
 
 # Customers CRUD with Purchase History (Admin only)
 @app.route('/customers', methods=['GET', 'POST'])
@@ -359,41 +1865,46 @@ def customers():
     if 'uid' not in session or session['user_type'] != 'Admin':
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
     
     purchases = None
+    purchase_totals = None
     customer_name = None
     
     if request.method == 'POST':
         if 'add' in request.form:
             name = request.form['name']
             c.execute("INSERT INTO Customer (Name) VALUES (?)", (name,))
+            record_change('insert', 'Customer', {'CID': c.lastrowid, 'Name': name})
         elif 'delete' in request.form:
             cid = int(request.form['cid'])
             c.execute("DELETE FROM Customer WHERE CID = ?", (cid,))
+            record_change('delete', 'Customer', where={'CID': cid})
         elif 'view_purchases' in request.form:
             cid = int(request.form['cid'])
+            c = get_read_db().cursor()
             c.execute("SELECT Name FROM Customer WHERE CID = ?", (cid,))
             customer_name = c.fetchone()[0]
-            c.execute('''SELECT p.PID, p.Name, p.Price, p.Category, b.DiscountApplied, d.Percentage
+            # Prices come from the ledger, as they were when each product was bought
+            c.execute('''SELECT b.PID, p.Name, b.UnitPrice, p.Category, b.DiscountApplied, b.FinalPrice * b.Quantity,
+                                b.Quantity, b.PurchasedAt
                          FROM Buys b
-                         JOIN Product p ON b.PID = p.PID
-                         LEFT JOIN Discount d ON d.CID = b.CID AND d.Category = p.Category
-                         WHERE b.CID = ?''', (cid,))
-            purchases_raw = c.fetchall()
-            purchases = []
-            for pid, name, price, category, discount_applied, percentage in purchases_raw:
-                discounted_price = price * (1 - percentage / 100) if discount_applied and percentage else price
-                purchases.append((pid, name, price, category, discount_applied, discounted_price))
+                         LEFT JOIN Product p ON b.PID = p.PID
+                         WHERE b.CID = ?
+                         ORDER BY b.PID''', (cid,))
+            purchases = c.fetchall()
+            c.execute("SELECT Purchases, Spent FROM CustomerTotals WHERE CID = ?", (cid,))
+            purchase_totals = c.fetchone() or (0, 0.0)
         conn.commit()
-        sync_to_file()
+        sync_changes()
     
+    c = get_read_db().cursor()
     c.execute("SELECT * FROM Customer")
     customers = c.fetchall()
     
-    conn.close()
-    return render_template('customers.html', customers=customers, purchases=purchases, customer_name=customer_name)
+    return render_template('customers.html', customers=customers, purchases=purchases,
+                           purchase_totals=purchase_totals, customer_name=customer_name)
 
 # Vendors CRUD with Performance Analysis (Admin only)
 @app.route('/vendors', methods=['GET', 'POST'])
@@ -401,7 +1912,7 @@ def vendors():
     if 'uid' not in session or session['user_type'] != 'Admin':
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
     
     performance = None
@@ -411,57 +1922,176 @@ def vendors():
         if 'add' in request.form:
             name = request.form['name']
             c.execute("INSERT INTO Vendor (Name) VALUES (?)", (name,))
+            record_change('insert', 'Vendor', {'VID': c.lastrowid, 'Name': name})
         elif 'delete' in request.form:
             vid = int(request.form['vid'])
             c.execute("DELETE FROM Vendor WHERE VID = ?", (vid,))
+            record_change('delete', 'Vendor', where={'VID': vid})
         elif 'view_performance' in request.form:
             vid = int(request.form['vid'])
-            c.execute("SELECT Name FROM Vendor WHERE VID = ?", (vid,))
-            vendor_name = c.fetchone()[0]
-            
-            c.execute("SELECT COUNT(*) FROM Supplies WHERE VID = ?", (vid,))
-            total_products = c.fetchone()[0]
-            
-            c.execute('''SELECT COUNT(b.PID), SUM(p.Price)
-                         FROM Supplies s
-                         JOIN Product p ON s.PID = p.PID
-                         LEFT JOIN Buys b ON p.PID = b.PID
-                         WHERE s.VID = ?''', (vid,))
-            sales, revenue = c.fetchone()
-            sales = sales if sales else 0
-            revenue = revenue if revenue else 0.0
-            
-            c.execute('''SELECT p.PID, p.Name, COUNT(b.PID) as purchase_count
-                         FROM Supplies s
-                         JOIN Product p ON s.PID = p.PID
-                         LEFT JOIN Buys b ON p.PID = b.PID
-                         WHERE s.VID = ?
-                         GROUP BY p.PID, p.Name
-                         ORDER BY purchase_count DESC
-                         LIMIT 1''', (vid,))
-            popular_product = c.fetchone()
-            popular_product_name = popular_product[1] if popular_product and popular_product[2] > 0 else "None"
-            popular_product_purchases = popular_product[2] if popular_product and popular_product[2] > 0 else 0
-            
-            performance = {
-                'total_products': total_products,
-                'total_sales': sales,
-                'revenue': revenue,
-                'popular_product_name': popular_product_name,
-                'popular_product_purchases': popular_product_purchases
-            }
+            performance = vendor_stats().get(vid)
+            vendor_name = performance['name'] if performance else None
         conn.commit()
-        sync_to_file()
+        sync_changes()
     
-    search = request.args.get('search', '')
+    c = get_read_db().cursor()
+    search = fts_query(request.args.get('search', ''))
     if search:
-        c.execute("SELECT * FROM Vendor WHERE Name LIKE ?", (f'%{search}%',))
+        c.execute('''SELECT v.*
+                     FROM VendorSearch vs
+                     JOIN Vendor v ON v.VID = vs.rowid
+                     WHERE VendorSearch MATCH ?
+                     ORDER BY vs.rank''', (search,))
     else:
         c.execute("SELECT * FROM Vendor")
     vendors = c.fetchall()
     
-    conn.close()
-    return render_template('vendors.html', vendors=vendors, performance=performance, vendor_name=vendor_name)
+    leaderboard = sorted(vendor_stats().values(), key=lambda stats: stats['revenue'], reverse=True)
+    return render_template('vendors.html', vendors=vendors, performance=performance, vendor_name=vendor_name,
+                           leaderboard=leaderboard[:app.config['LEADERBOARD_SIZE']])
+
+# Performance figures for every vendor, computed in one pass and cached until purchases,
+# supplies or prices change. Each product's purchases are counted once, then rolled up per vendor
+# along with its most popular product (most purchases, lowest PID on ties).
+_vendor_stats = None
+_vendor_stats_lock = threading.Lock()
+
+def vendor_stats():
+    global _vendor_stats
+    with _vendor_stats_lock:
+        if _vendor_stats is None:
+            _vendor_stats = compute_vendor_stats(get_db().cursor())
+        return _vendor_stats
+
+# Figures for every vendor, or only for the vendors in vids
+def compute_vendor_stats(c, vids=None):
+    sales_where = supplied_where = vendor_where = ''
+    params = []
+    if vids:
+        vendors_in = f"IN ({', '.join('?' * len(vids))})"
+        sales_where = f"WHERE PID IN (SELECT PID FROM Supplies WHERE VID {vendors_in})"
+        supplied_where = f"WHERE s.VID {vendors_in}"
+        vendor_where = f"WHERE v.VID {vendors_in}"
+        params = list(vids) * 3
+    c.execute(f'''WITH sales AS (SELECT PID, COUNT(*) AS Purchases, SUM(FinalPrice * Quantity) AS Revenue
+                                FROM Buys
+                                {sales_where}
+                                GROUP BY PID),
+                  supplied AS (
+                      SELECT s.VID, p.PID, p.Name, sa.Revenue, COALESCE(sa.Purchases, 0) AS Purchases,
+                             ROW_NUMBER() OVER (PARTITION BY s.VID
+                                                ORDER BY COALESCE(sa.Purchases, 0) DESC, p.PID) AS Position
+                      FROM Supplies s
+                      LEFT JOIN Product p ON p.PID = s.PID
+                      LEFT JOIN sales sa ON sa.PID = p.PID
+                      {supplied_where})
+                  SELECT v.VID, v.Name, COUNT(su.VID), COALESCE(SUM(su.Purchases), 0),
+                         COALESCE(SUM(su.Revenue), 0.0),
+                         MAX(CASE WHEN su.Position = 1 THEN su.PID END),
+                         MAX(CASE WHEN su.Position = 1 THEN su.Name END),
+                         MAX(CASE WHEN su.Position = 1 THEN su.Purchases END)
+                  FROM Vendor v
+                  LEFT JOIN supplied su ON su.VID = v.VID
+                  {vendor_where}
+                  GROUP BY v.VID''', params)
+    stats = {}
+    for vid, name, total_products, sales, revenue, top_pid, top_name, top_purchases in c.fetchall():
+        stats[vid] = {
+            'vid': vid,
+            'name': name,
+            'total_products': total_products,
+            'total_sales': sales,
+            'revenue': revenue,
+            'popular_product_pid': top_pid if top_purchases else None,
+            'popular_product_name': top_name if top_purchases else "None",
+            'popular_product_purchases': top_purchases or 0
+        }
+    return stats
+
+# New purchases, from this process or another, recompute the cached figures of the vendors that
+# supply the products bought; any other change to the tables the figures depend on drops the
+# cache so the next view recomputes it. Figures are always recomputed from a fresh read rather
+# than adjusted, so a purchase already counted by a computation that ran between its commit
+# and this listener is never counted twice.
+@on_change
+def update_vendor_stats(changes):
+    global _vendor_stats
+    with _vendor_stats_lock:
+        if _vendor_stats is None:
+            return
+        pids = set()
+        for change in changes:
+            if change['table'] == 'Buys' and change['op'] == 'insert':
+                pids.add(change['row']['PID'])
+            elif change['table'] in ('Buys', 'Supplies', 'Product', 'Vendor'):
+                _vendor_stats = None
+                return
+        if not pids:
+            return
+        c = get_db().cursor()
+        c.execute(f"SELECT DISTINCT VID FROM Supplies WHERE PID IN ({', '.join('?' * len(pids))})", list(pids))
+        vids = [row[0] for row in c.fetchall()]
+        if vids:
+            _vendor_stats.update(compute_vendor_stats(c, vids))
+
+# Sales reports (Admin only), read from the hourly/daily rollups without touching Buys: revenue
+# per hour or day over a range of UTC dates (both ends included, the last 7 days by default) and
+# the LEADERBOARD_SIZE top sellers by product, category and vendor over the same days
+REPORT_DIMENSIONS = {
+    'product': ('ProductSales', 'PID', "(SELECT Name FROM Product WHERE PID = s.PID)"),
+    'category': ('CategorySales', 'Category', "s.Category"),
+    'vendor': ('VendorSales', 'VID', "(SELECT Name FROM Vendor WHERE VID = s.VID)"),
+}
+
+@app.template_filter('utc')
+def format_utc(timestamp, fmt='%Y-%m-%d %H:%M'):
+    if timestamp is None:
+        return ''
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime(fmt)
+
+# Start of the UTC day given as YYYY-MM-DD, or default if it's missing or malformed
+def parse_day(value, default):
+    try:
+        day = datetime.datetime.strptime(value or '', '%Y-%m-%d')
+    except ValueError:
+        return default
+    return int(day.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+@app.route('/reports')
+def reports():
+    if 'uid' not in session or session['user_type'] != 'Admin':
+        return redirect(url_for('login'))
+    
+    today = int(time.time()) // 86400 * 86400
+    start = parse_day(request.args.get('from'), today - 6 * 86400)
+    end = parse_day(request.args.get('to'), today)
+    start, end = min(start, end), max(start, end) + 86400
+    period = request.args.get('period', 'day')
+    if period not in ('hour', 'day'):
+        period = 'day'
+    
+    c = get_read_db().cursor()
+    # Every purchase is in exactly one category bucket, so the category rollup gives the totals
+    c.execute('''SELECT Start, SUM(Orders), SUM(Units), SUM(Revenue)
+                 FROM CategorySales
+                 WHERE Period = ? AND Start >= ? AND Start < ?
+                 GROUP BY Start
+                 ORDER BY Start''', (period, start, end))
+    series = c.fetchall()
+    totals = [sum(row[i] for row in series) for i in (1, 2, 3)]
+    
+    top_sellers = {}
+    for dimension, (table, key, name) in REPORT_DIMENSIONS.items():
+        c.execute(f'''SELECT s.{key}, {name}, SUM(s.Orders), SUM(s.Units), SUM(s.Revenue) AS Revenue
+                      FROM {table} s
+                      WHERE s.Period = 'day' AND s.Start >= ? AND s.Start < ?
+                      GROUP BY s.{key}
+                      ORDER BY Revenue DESC
+                      LIMIT ?''', (start, end, app.config['LEADERBOARD_SIZE']))
+        top_sellers[dimension] = c.fetchall()
+    
+    return render_template('reports.html', series=series, totals=totals, top_sellers=top_sellers, period=period,
+                           start=format_utc(start, '%Y-%m-%d'), end=format_utc(end - 86400, '%Y-%m-%d'))
 
 # Discounts CRUD with Category-Based Discounts and Recommendations (Admin only)
 @app.route('/discounts', methods=['GET', 'POST'])
@@ -469,7 +2099,7 @@ def discounts():
     if 'uid' not in session or session['user_type'] != 'Admin':
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect('database.db')
+    conn = get_db()
     c = conn.cursor()
     
     recommendations = None
@@ -482,52 +2112,25 @@ def discounts():
             type_ = request.form['type']
             c.execute("INSERT INTO Discount (Percentage, Type, CID, Category) VALUES (?, ?, NULL, NULL)", 
                      (percentage, type_))
+            record_change('insert', 'Discount', {'DID': c.lastrowid, 'Percentage': percentage, 'Type': type_,
+                                                 'CID': None, 'Category': None})
         elif 'delete' in request.form:
             did = int(request.form['did'])
             c.execute("DELETE FROM Discount WHERE DID = ?", (did,))
+            record_change('delete', 'Discount', where={'DID': did})
         elif 'recommend' in request.form:
             cid = int(request.form['cid'])
             c.execute("SELECT Name FROM Customer WHERE CID = ?", (cid,))
             customer_name_rec = c.fetchone()[0]
             
-            c.execute('''SELECT DISTINCT p.Category
-                         FROM Buys b
-                         JOIN Product p ON b.PID = p.PID
-                         WHERE b.CID = ?''', (cid,))
-            categories = [row[0] for row in c.fetchall()]
-            
-            if categories:
-                c.execute('''SELECT p.Category, COUNT(b.PID) as purchase_count
-                             FROM Buys b
-                             JOIN Product p ON b.PID = p.PID
-                             WHERE b.CID = ?
-                             GROUP BY p.Category
-                             ORDER BY purchase_count DESC''', (cid,))
-                category_purchases = {row[0]: row[1] for row in c.fetchall()}
-                
-                c.execute('''SELECT p.PID, p.Name, p.Price, p.Category, d.Percentage
-                             FROM Product p
-                             LEFT JOIN Discount d ON p.Category = d.Category AND d.CID = ?
-                             WHERE p.Category IN ({})
-                             AND p.PID NOT IN (
-                                 SELECT PID FROM Buys WHERE CID = ?
-                             )'''.format(','.join('?' * len(categories))), [cid] + categories + [cid])
-                recs = c.fetchall()
-                
-                recommendations = []
-                seen_categories = set()
-                for pid, name, price, category, percentage in recs:
-                    if category not in seen_categories:
-                        recommendations.append({
-                            'PID': pid,
-                            'Name': name,
-                            'Price': price,
-                            'Category': category,
-                            'Discount': percentage if percentage else 'None',
-                            'PurchaseCount': category_purchases.get(category, 0),
-                            'CID': cid
-                        })
-                        seen_categories.add(category)
+            # Served from the batch-computed table; customers it hasn't covered yet are scored now
+            recommendations = customer_recommendations(c, cid)
+            if not recommendations:
+                refresh_recommendations(c, cid)
+                recommendations = customer_recommendations(c, cid)
+        elif 'refresh_recommendations' in request.form:
+            count = refresh_recommendations(c)
+            discount_message = f"Generated {count} recommendations for all customers."
         elif 'add_discount' in request.form:
             cid = int(request.form['cid'])
             category = request.form['category']
@@ -543,12 +2146,11 @@ def discounts():
             used_percentages = [row[1] for row in existing_discounts]
             
             # Determine next available discount tier
-            available_tiers = [(15.0, 5), (10.0, 10), (5.0, 20)]  # (percentage, min_total_purchases)
-            c.execute("SELECT COUNT(*) FROM Buys WHERE CID = ?", (cid,))
+            c.execute("SELECT COALESCE(MAX(Purchases), 0) FROM CustomerTotals WHERE CID = ?", (cid,))
             total_purchases = c.fetchone()[0]
             
             discount_percentage = None
-            for percentage, min_purchases in available_tiers:
+            for percentage, min_purchases in REWARD_TIERS:
                 if percentage not in used_percentages and total_purchases >= min_purchases:
                     discount_percentage = percentage
                     break
@@ -558,6 +2160,8 @@ def discounts():
                 if not c.fetchone():
                     c.execute("INSERT INTO Discount (Percentage, Type, CID, Category) VALUES (?, 'Rewards', ?, ?)", 
                              (discount_percentage, cid, category))
+                    record_change('insert', 'Discount', {'DID': c.lastrowid, 'Percentage': discount_percentage,
+                                                         'Type': 'Rewards', 'CID': cid, 'Category': category})
                     discount_message = f"Added {discount_percentage}% discount on {category} products for {customer_name} (CID: {cid})."
                 else:
                     discount_message = f"Discount already exists for {category} for {customer_name} (CID: {cid})."
@@ -565,8 +2169,9 @@ def discounts():
                 discount_message = f"No eligible discount tier available for {customer_name} (CID: {cid}). Total purchases: {total_purchases}."
         
         conn.commit()
-        sync_to_file()
+        sync_changes()
     
+    c = get_read_db().cursor()
     c.execute('''SELECT d.DID, d.Percentage, d.Type, d.Category, c.CID, c.Name AS CustomerName
                  FROM Discount d
                  LEFT JOIN Customer c ON d.CID = c.CID''')
@@ -574,11 +2179,316 @@ def discounts():
     c.execute("SELECT CID, Name FROM Customer")
     customers = c.fetchall()
     
-    conn.close()
     return render_template('discounts.html', discounts=discounts, customers=customers,
                          recommendations=recommendations, customer_name_rec=customer_name_rec,
                          discount_message=discount_message)
 
+# Rebuild the Recommendation table in one set-based pass: each customer's most-purchased
+# categories (from CategoryPurchases) are ranked, and each is paired with the lowest-PID
+# product in that category the customer hasn't bought. Pass cid to rebuild one customer only.
+def refresh_recommendations(c, cid=None):
+    where = "WHERE Purchases > 0" + (" AND CID = ?" if cid is not None else "")
+    params = [cid] if cid is not None else []
+    c.execute("DELETE FROM Recommendation" + (" WHERE CID = ?" if cid is not None else ""), params)
+    c.execute(f'''INSERT INTO Recommendation (CID, Rank, PID, Category, PurchaseCount)
+                  SELECT CID, Rank, PID, Category, Purchases
+                  FROM (SELECT r.CID, r.Rank, r.Category, r.Purchases,
+                               (SELECT p.PID FROM Product p
+                                WHERE p.Category = r.Category
+                                AND NOT EXISTS (SELECT 1 FROM Buys b WHERE b.CID = r.CID AND b.PID = p.PID)
+                                ORDER BY p.PID
+                                LIMIT 1) AS PID
+                        FROM (SELECT CID, Category, Purchases,
+                                     ROW_NUMBER() OVER (PARTITION BY CID ORDER BY Purchases DESC, Category) AS Rank
+                              FROM CategoryPurchases
+                              {where}) r
+                        WHERE r.Rank <= ?)
+                  WHERE PID IS NOT NULL''', params + [app.config['RECOMMENDATIONS_PER_CUSTOMER']])
+    return c.rowcount
+
+# A customer's stored recommendations that are still unpurchased, best first
+def customer_recommendations(c, cid):
+    c.execute('''SELECT r.PID, p.Name, p.Category, r.PurchaseCount
+                 FROM Recommendation r
+                 JOIN Product p ON p.PID = r.PID
+                 WHERE r.CID = ?
+                 AND NOT EXISTS (SELECT 1 FROM Buys b WHERE b.CID = r.CID AND b.PID = r.PID)
+                 ORDER BY r.Rank''', (cid,))
+    rows = c.fetchall()
+    prices = pricing.price_many(c, cid, [row[0] for row in rows])
+    return [{
+        'PID': pid,
+        'Name': name,
+        'Price': prices[pid][0],
+        'Category': category,
+        'Discount': prices[pid][1] if prices[pid][1] else 'None',
+        'PurchaseCount': purchase_count,
+        'CID': cid
+    } for pid, name, category, purchase_count in rows]
+
+# Bulk import (Admin only). POST a CSV file with a header row, or NDJSON with one object per line,
+# as the 'file' form field or as the raw request body, with ?kind= one of IMPORTERS. Rows are
+# validated and loaded IMPORT_CHUNK_SIZE at a time, each chunk in its own transaction, and one
+# NDJSON progress line per chunk (rows read, rows imported, per-line errors) is streamed back
+# as the upload is processed, followed by a summary line.
+@app.route('/import', methods=['POST'])
+def bulk_import():
+    if 'uid' not in session or session['user_type'] != 'Admin':
+        return redirect(url_for('login'))
+    
+    kind = request.values.get('kind')
+    if kind not in IMPORTERS:
+        abort(400, f"kind must be one of {', '.join(IMPORTERS)}")
+    upload = request.files.get('file')
+    filename = upload.filename if upload else ''
+    fmt = request.values.get('format')
+    if fmt is None:
+        is_ndjson = filename.endswith(('.ndjson', '.jsonl')) or \
+            request.mimetype in ('application/x-ndjson', 'application/jsonl')
+        fmt = 'ndjson' if is_ndjson else 'csv'
+    if upload:
+        # The upload is closed when the view returns, before the response is streamed
+        stream = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        shutil.copyfileobj(upload.stream, stream)
+        stream.seek(0)
+    else:
+        stream = request.stream
+    records = read_records(stream, fmt)
+    return Response(stream_with_context(import_chunks(kind, records)), mimetype='application/x-ndjson')
+
+# Yield (line number, record) pairs from an uploaded file; record is None for unparseable lines
+def read_records(stream, fmt):
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    if fmt == 'ndjson':
+        for number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield number, record if isinstance(record, dict) else None
+    else:
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+
+def import_chunks(kind, records):
+    parse, load = IMPORTERS[kind]
+    conn = get_db()
+    imported = rejected = 0
+    for number, chunk in enumerate(iter(lambda: list(itertools.islice(records, app.config['IMPORT_CHUNK_SIZE'])), []),
+                                   start=1):
+        rows = []
+        errors = []
+        for line, record in chunk:
+            if record is None:
+                errors.append({'line': line, 'error': "not a valid record"})
+                continue
+            try:
+                rows.append((line, parse({key.strip().lower(): value for key, value in record.items() if key})))
+            except ValueError as error:
+                errors.append({'line': line, 'error': str(error)})
+        
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # Keys for new rows are assigned from the current maximum
+            count = load(conn.cursor(), rows, errors)
+            conn.commit()
+        except sqlite3.Error as error:
+            conn.rollback()
+            g.pop('changes', None)
+            errors.append({'error': f"chunk rolled back: {error}"})
+            count = 0
+        sync_changes()
+        
+        imported += count
+        rejected += len(chunk) - count
+        yield json.dumps({'chunk': number, 'rows': len(chunk), 'imported': count, 'errors': errors}) + '\n'
+    yield json.dumps({'done': True, 'imported': imported, 'rejected': rejected}) + '\n'
+
+# Read a field from a record whose keys were lowercased; convert turns the text into its value
+def import_field(record, name, convert=str):
+    value = record.get(name.lower())
+    if value is None or (isinstance(value, str) and not value.strip()):
+        raise ValueError(f"missing {name}")
+    try:
+        value = convert(value.strip() if isinstance(value, str) else value)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid {name}: {value!r}")
+    if convert is float and (value != value or value < 0):
+        raise ValueError(f"invalid {name}: {value!r}")
+    return value
+
+# Read a name or category. sample_data.txt is comma-separated with '#' comments, so while it is
+# the DATA_FILE those characters (and line breaks) are refused rather than written to a
+# snapshot that couldn't be loaded again.
+TEXT_FORMAT_RESERVED = re.compile(r'[,#\r\n]')
+
+def import_text(record, name):
+    value = import_field(record, name)
+    if not snapshot.is_snapshot_path(app.config['DATA_FILE']) and TEXT_FORMAT_RESERVED.search(value):
+        raise ValueError(f"invalid {name}: {value!r} (',', '#' and line breaks need a .snap DATA_FILE)")
+    return value
+
+# Next key for table: past both the largest key in use and any AUTOINCREMENT key handed out
+# before, so imported rows never reuse the key of a deleted one
+def next_key(c, table, key):
+    c.execute(f'''SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0),
+                             COALESCE((SELECT MAX({key}) FROM {table}), 0)) + 1''', (table,))
+    return c.fetchone()[0]
+
+# The subset of keys that exist in table
+def existing_keys(c, table, key, keys):
+    keys = list(set(keys))
+    c.execute(f"SELECT {key} FROM {table} WHERE {key} IN ({', '.join('?' * len(keys))})", keys)
+    return {row[0] for row in c.fetchall()}
+
+def parse_product(record):
+    return (import_field(record, 'Price', float), import_text(record, 'Name'), import_text(record, 'Category'))
+
+def load_products(c, rows, errors):
+    pid = next_key(c, 'Product', 'PID')
+    batch = [(pid + i, price, name, category) for i, (_, (price, name, category)) in enumerate(rows)]
+    c.executemany("INSERT INTO Product (PID, Price, Name, Category) VALUES (?, ?, ?, ?)", batch)
+    for pid, price, name, category in batch:
+        record_change('insert', 'Product', {'PID': pid, 'Price': price, 'Name': name, 'Category': category})
+    return len(batch)
+
+def parse_vendor(record):
+    return import_text(record, 'Name')
+
+def load_vendors(c, rows, errors):
+    vid = next_key(c, 'Vendor', 'VID')
+    batch = [(vid + i, name) for i, (_, name) in enumerate(rows)]
+    c.executemany("INSERT INTO Vendor (VID, Name) VALUES (?, ?)", batch)
+    for vid, name in batch:
+        record_change('insert', 'Vendor', {'VID': vid, 'Name': name})
+    return len(batch)
+
+def parse_supply(record):
+    return import_field(record, 'VID', int), import_field(record, 'PID', int)
+
+def load_supplies(c, rows, errors):
+    if not rows:
+        return 0
+    vids = existing_keys(c, 'Vendor', 'VID', [vid for _, (vid, _) in rows])
+    pids = existing_keys(c, 'Product', 'PID', [pid for _, (_, pid) in rows])
+    c.execute(f"SELECT VID, PID FROM Supplies WHERE PID IN ({', '.join('?' * len(pids))})", list(pids))
+    seen = set(c.fetchall())
+    batch = []
+    for line, (vid, pid) in rows:
+        if vid not in vids:
+            errors.append({'line': line, 'error': f"no vendor with VID {vid}"})
+        elif pid not in pids:
+            errors.append({'line': line, 'error': f"no product with PID {pid}"})
+        elif (vid, pid) in seen:
+            errors.append({'line': line, 'error': f"vendor {vid} already supplies product {pid}"})
+        else:
+            seen.add((vid, pid))
+            batch.append((vid, pid))
+    c.executemany("INSERT INTO Supplies (VID, PID) VALUES (?, ?)", batch)
+    for vid, pid in batch:
+        record_change('insert', 'Supplies', {'VID': vid, 'PID': pid})
+    return len(batch)
+
+def parse_price(record):
+    return import_field(record, 'PID', int), import_field(record, 'Price', float)
+
+def load_prices(c, rows, errors):
+    if not rows:
+        return 0
+    pids = existing_keys(c, 'Product', 'PID', [pid for _, (pid, _) in rows])
+    batch = []
+    for line, (pid, price) in rows:
+        if pid in pids:
+            batch.append((price, pid))
+        else:
+            errors.append({'line': line, 'error': f"no product with PID {pid}"})
+    c.executemany("UPDATE Product SET Price = ? WHERE PID = ?", batch)
+    for price, pid in batch:
+        record_change('update', 'Product', key={'PID': pid}, values={'Price': price})
+    return len(batch)
+
+# kind -> (parse a record into a row or raise ValueError, load a chunk of (line, row) pairs)
+IMPORTERS = {
+    'products': (parse_product, load_products),
+    'vendors': (parse_vendor, load_vendors),
+    'supplies': (parse_supply, load_supplies),
+    'prices': (parse_price, load_prices),
+}
+
+# Bulk export (Admin only): /export/<table>?format=csv|ndjson. Rows are streamed from a cursor
+# in key order, so the table is never held in memory.
+EXPORT_TABLES = {
+    'products': 'Product',
+    'customers': 'Customer',
+    'vendors': 'Vendor',
+    'supplies': 'Supplies',
+    'buys': 'Buys',
+    'discounts': 'Discount',
+}
+
+@app.route('/export/<table>')
+def bulk_export(table):
+    if 'uid' not in session or session['user_type'] != 'Admin':
+        return redirect(url_for('login'))
+    if table not in EXPORT_TABLES:
+        abort(404)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        abort(400, "format must be csv or ndjson")
+    
+    def generate():
+        c = get_read_db().cursor()
+        name = EXPORT_TABLES[table]
+        c.execute(f"SELECT * FROM {name} ORDER BY {', '.join(TABLE_KEYS[name])}")
+        columns = [column[0] for column in c.description]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == 'csv':
+            writer.writerow(columns)
+        for row in c:
+            if fmt == 'csv':
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(columns, row))) + '\n')
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={table}.{fmt}'})
+
+# Prometheus scrape endpoint; open to admins, or to scrapers sending "Authorization: Bearer
+# <METRICS_TOKEN>" when a token is configured
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if session.get('user_type') != 'Admin' and \
+            not (token and request.headers.get('Authorization') == f'Bearer {token}'):
+        abort(403)
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+# Nightly batch job: flask --app app recommend
+@app.cli.command('recommend')
+def recommend_command():
+    conn = connect_db()
+    started = time.perf_counter()
+    count = refresh_recommendations(conn.cursor())
+    conn.commit()
+    conn.close()
+    print(f"Generated {count} recommendations in {time.perf_counter() - started:.2f}s")
+
 if __name__ == '__main__':
-    init_db()
+    stats = start_worker()
+    if stats and stats['warm']:
+        print(f"Reused database.db ({format_timings(stats['timings'])})")
+    elif stats:
+        print(f"Loaded {stats['rows']} rows in {stats['load_seconds']:.2f}s ({stats['rows_per_second']:.0f} rows/sec)")
+        print(f"Startup: {format_timings(stats['timings'])}")
+    else:
+        print("Reusing database.db, which another process is serving")
     app.run(debug=True)
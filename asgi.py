@@ -0,0 +1,142 @@
+# ASGI entry point for the eCommerce Simulator, e.g. `uvicorn asgi:application`.
+# The event loop only moves bytes: each request runs the Flask app in app.py on a dedicated
+# pool of ASGI_WORKERS threads, so blocking SQLite work never stalls the loop and many shop
+# requests are served concurrently from one process. Journal compaction already happens on
+# its own background thread, off the request path. Several worker processes can serve the same
+# database (`--workers N`); see start_worker() in app.py.
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import app as shop
+
+class ASGIApp:
+    def __init__(self, wsgi_app, workers):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='request')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    # Load the database on startup and fold the journal into the snapshot on shutdown
+    async def lifespan(self, receive, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await loop.run_in_executor(self.executor, startup)
+                except Exception as e:
+                    # The server exits instead of serving without a database
+                    shop.app.logger.exception("Startup failed")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await loop.run_in_executor(self.executor, shop.compact_journal)
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # The request body is not read up front: the handler reads it from wsgi.input, which pulls
+    # each body message from the loop as it is needed, so uploads are streamed through
+    async def http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, io.BufferedReader(RequestBody(receive, loop), BODY_BUFFER_SIZE))
+        await loop.run_in_executor(self.executor, self.run_wsgi, environ, send, loop)
+
+    # Runs on a worker thread. The response is passed back to the loop chunk by chunk, so
+    # streamed responses reach the client as they are generated.
+    def run_wsgi(self, environ, send, loop):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            send_sync({'type': 'http.response.start', 'status': response['status'],
+                       'headers': response['headers']})
+            for chunk in result:
+                if chunk:
+                    send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_sync({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+BODY_BUFFER_SIZE = 64 * 1024
+
+# Raw wsgi.input stream over the ASGI receive channel. Runs on a worker thread: each read waits
+# for the next http.request message on the loop. A client that disconnects ends the body early.
+class RequestBody(io.RawIOBase):
+    def __init__(self, receive, loop):
+        self.receive = receive
+        self.loop = loop
+        self.chunk = memoryview(b'')
+        self.more_body = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.chunk and self.more_body:
+            message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+            if message['type'] == 'http.disconnect':
+                self.more_body = False
+            else:
+                self.chunk = memoryview(message.get('body', b''))
+                self.more_body = message.get('more_body', False)
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+# Translate an ASGI HTTP scope into a WSGI environ (PEP 3333)
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def startup():
+    shop.start_worker()
+
+application = ASGIApp(shop.app, shop.app.config['ASGI_WORKERS'])
@@ -0,0 +1,580 @@
+# Performance tooling for the eCommerce Simulator: a synthetic sample_data.txt generator
+# and checks that run app.py against it. Run `python benchmark.py --help` for the commands.
+import argparse
+import http.cookiejar
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from werkzeug.serving import make_server
+
+import app as shop_app
+
+CATEGORIES = ['Electronics', 'Clothing', 'Books', 'Furniture', 'Toys', 'Sports', 'Stationery',
+              'Home Decor', 'Beauty', 'Automotive', 'Gardening', 'Health', 'Jewelry',
+              'Kitchenware', 'Pet Supplies']
+ADJECTIVES = ['Deluxe', 'Classic', 'Compact', 'Wireless', 'Organic', 'Vintage', 'Portable', 'Premium',
+              'Smart', 'Eco', 'Ultra', 'Mini', 'Rustic', 'Modern', 'Heavy Duty', 'Handmade']
+NOUNS = ['Lamp', 'Chair', 'Desk', 'Speaker', 'Notebook', 'Jacket', 'Blender', 'Kettle', 'Backpack',
+         'Watch', 'Necklace', 'Helmet', 'Planter', 'Leash', 'Vitamins', 'Puzzle', 'Candle', 'Charger',
+         'Mug', 'Rug', 'Sneakers', 'Novel', 'Headphones', 'Skillet', 'Drone']
+
+# Cumulative Zipf weights for n ranked items: item k is chosen with probability ~ 1 / k**skew.
+# skew=0 gives a uniform distribution.
+def zipf_weights(n, skew):
+    return list(itertools.accumulate(1 / (k ** skew) for k in range(1, n + 1)))
+
+# Write a sample_data.txt-format file with the given number of rows per table.
+# Customer N logs in as customerN/123; the admin login is admin/admin123. With skew > 0 a few
+# categories hold most products, a few products get most purchases, and the number of
+# purchases per customer is exponentially distributed around the `purchases` mean.
+def generate_sample_data(path, products=1000, customers=100, vendors=20, purchases=10, skew=1.0, seed=0):
+    rng = random.Random(seed)
+    category_weights = zipf_weights(len(CATEGORIES), skew)
+    popularity = list(range(1, products + 1))
+    rng.shuffle(popularity)
+    product_weights = zipf_weights(products, skew)
+    now = int(time.time())
+    with open(path, 'w') as f:
+        f.write("# Synthetic data generated by benchmark.py\n")
+
+        f.write("\nPRODUCTS\n")
+        for pid in range(1, products + 1):
+            name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {pid}"
+            category = rng.choices(CATEGORIES, cum_weights=category_weights)[0]
+            f.write(f"{rng.uniform(1, 500):.2f},{name},{category}\n")
+
+        f.write("\nCUSTOMERS\n")
+        for cid in range(1, customers + 1):
+            f.write(f"Customer {cid}\n")
+
+        f.write("\nVENDORS\n")
+        for vid in range(1, vendors + 1):
+            f.write(f"Vendor {vid}\n")
+
+        f.write("\nBUYS\n")
+        for cid in range(1, customers + 1):
+            count = min(products, round(rng.expovariate(1 / purchases))) if purchases else 0
+            bought = set()
+            for _ in range(3):  # Popular products repeat under heavy skew; top up with a few more draws
+                bought.update(rng.choices(popularity, cum_weights=product_weights, k=count - len(bought)))
+                if len(bought) >= count:
+                    break
+            for pid in sorted(bought):
+                # Bought some time in the last 30 days; prices are filled in from the catalog on load
+                purchased_at = now - rng.randrange(30 * 86400)
+                f.write(f"{cid},{pid},0,,,,{purchased_at},{rng.choice((1, 1, 1, 2, 3))}\n")
+
+        f.write("\nSUPPLIES\n")
+        for pid in range(1, products + 1):
+            f.write(f"{rng.randint(1, vendors)},{pid}\n")
+
+        f.write("\nDISCOUNTS\n")
+        for cid in range(1, customers + 1, 3):
+            f.write(f"15.0,Rewards,{cid},{rng.choice(CATEGORIES)}\n")
+
+        f.write("\nUSERS\n")
+        f.write("admin,admin123,Admin,NULL\n")
+        for cid in range(1, customers + 1):
+            f.write(f"customer{cid},123,Customer,Customer {cid}\n")
+
+# Point app.py at a fresh database seeded from a synthetic data file in workdir
+def load_synthetic_db(workdir, **scale):
+    data_file = os.path.join(workdir, 'sample_data.txt')
+    generate_sample_data(data_file, **scale)
+    shop_app.app.config.update(
+        DATABASE=os.path.join(workdir, 'database.db'),
+        DATA_FILE=data_file,
+        JOURNAL_FILE=os.path.join(workdir, 'sample_data.journal'),
+    )
+    shop_app.init_db()
+
+def login(client, username, password):
+    client.get('/logout')
+    client.post('/', data={'username': username, 'password': password, 'login': 'Login'})
+
+# Requests that exercise every query in app.py. Each scenario lists the tables it may read in
+# full (the listing pages genuinely return every row); any other full scan or automatic index
+# is reported as a regression.
+PLAN_SCENARIOS = [
+    ('customer', 'GET', '/shop', None, set()),
+    ('customer', 'GET', '/shop?after=500&category=Books&min_price=10&max_price=200', None, set()),
+    ('customer', 'POST', '/shop', {'pid': 7, 'buy': 'Buy'}, set()),
+    ('admin', 'GET', '/products', None, set()),
+    ('admin', 'GET', '/products?after=500&category=Books&limit=20', None, set()),
+    ('admin', 'GET', '/products?search=Book', None, set()),
+    ('admin', 'GET', '/products?search=Boo&after_rank=-1e9&after=5', None, set()),
+    ('admin', 'POST', '/products', {'update': 'Update Price', 'pid': 3, 'price': '9.99'}, {'Product'}),
+    ('admin', 'GET', '/customers', None, {'Customer'}),
+    ('admin', 'POST', '/customers', {'view_purchases': 'View Purchases', 'cid': 1}, {'Customer'}),
+    # The first vendor page view builds the cached stats for every vendor in one full pass
+    ('admin', 'GET', '/vendors', None, {'Vendor', 'Supplies', 'Buys'}),
+    ('admin', 'GET', '/vendors?search=Vendor 1', None, set()),
+    ('admin', 'POST', '/vendors', {'view_performance': 'View Performance', 'vid': 1}, {'Vendor'}),
+    ('admin', 'GET', '/discounts', None, {'Discount', 'Customer'}),
+    ('admin', 'POST', '/discounts', {'recommend': 'Generate Recommendations', 'cid': 1}, {'Discount', 'Customer'}),
+    # The batch job reads every customer's category counters once
+    ('admin', 'POST', '/discounts', {'refresh_recommendations': 'Refresh'}, {'Discount', 'Customer', 'CategoryPurchases'}),
+    ('admin', 'POST', '/discounts', {'add_discount': 'Add Discount', 'cid': 1, 'category': 'Books'},
+     {'Discount', 'Customer'}),
+    # Exports stream whole tables by design
+    ('admin', 'GET', '/export/buys', None, {'Buys'}),
+    ('admin', 'GET', '/reports', None, set()),
+    ('admin', 'GET', '/reports?period=hour&from=2000-01-01', None, set()),
+    # With the vendor stats cached, a purchase recomputes the figures of the product's vendors
+    ('customer', 'POST', '/shop', {'pid': 8, 'buy': 'Buy'}, set()),
+]
+
+LOGINS = {'customer': ('customer1', '123'), 'admin': ('admin', 'admin123')}
+SKIPPED_STATEMENTS = ('--', 'PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+# Map the aliases used in a statement back to table names, e.g. "Product p" -> {'p': 'Product'}
+def table_aliases(sql):
+    aliases = {}
+    for table, alias in re.findall(r'(?:FROM|JOIN|INTO|UPDATE)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.I):
+        aliases[table] = table
+        if alias and alias.upper() not in ('ON', 'WHERE', 'LEFT', 'JOIN', 'GROUP', 'ORDER', 'SET', 'VALUES',
+                                           'LIMIT', 'INNER', 'USING'):
+            aliases[alias] = table
+    return aliases
+
+# Return the plan lines of sql that read a table in full or build a throwaway index
+def full_scans(conn, sql, allowed):
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    aliases = table_aliases(sql)
+    problems = []
+    subqueries = {}
+    for node, parent, _, detail in conn.execute("EXPLAIN QUERY PLAN " + sql):
+        match = re.match(r'(?:CO-ROUTINE|MATERIALIZE) (\w+)', detail)
+        if match:
+            subqueries[match.group(1)] = node
+            continue
+        match = re.match(r'(SCAN|SEARCH) (\w+)', detail)
+        if not match or 'VIRTUAL TABLE' in detail:
+            continue
+        # Reading back the rows of a bounded subquery is not a table scan
+        if match.group(2) in subqueries and parent != subqueries[match.group(2)]:
+            continue
+        table = aliases.get(match.group(2), match.group(2))
+        if table not in tables:
+            continue
+        if 'AUTOMATIC' in detail or (match.group(1) == 'SCAN' and table not in allowed):
+            problems.append(detail)
+    return problems
+
+def check_plans(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        load_synthetic_db(workdir, products=args.products, customers=args.customers, vendors=args.vendors,
+                          purchases=args.purchases, skew=args.skew, seed=args.seed)
+        statements = []
+        connect_db = shop_app.connect_db
+        connect_read_db = shop_app.connect_read_db
+        def traced_connect():
+            conn = connect_db()
+            conn.set_trace_callback(statements.append)
+            return conn
+        def traced_connect_read(path):
+            conn = connect_read_db(path)
+            conn.set_trace_callback(statements.append)
+            return conn
+        shop_app.connect_db = traced_connect
+        shop_app.connect_read_db = traced_connect_read
+        shop_app.drain_pool()
+
+        client = shop_app.app.test_client()
+        checked = set()
+        failures = 0
+        conn = connect_db()
+        for role, method, path, form, allowed in PLAN_SCENARIOS:
+            login(client, *LOGINS[role])
+            del statements[:]
+            response = client.open(path, method=method, data=form)
+            if response.status_code != 200:
+                print(f"FAIL {method} {path}: HTTP {response.status_code}")
+                failures += 1
+                continue
+            for sql in statements:
+                normalized = ' '.join(sql.split())
+                if normalized.upper().startswith(SKIPPED_STATEMENTS) or (normalized, path) in checked:
+                    continue
+                checked.add((normalized, path))
+                problems = full_scans(conn, normalized, allowed)
+                if problems:
+                    failures += 1
+                    print(f"FAIL {method} {path}\n  {normalized}")
+                    for detail in problems:
+                        print(f"    {detail}")
+                elif args.verbose:
+                    print(f"ok   {method} {path}\n  {normalized}")
+        conn.close()
+        shop_app.connect_db = connect_db
+        shop_app.connect_read_db = connect_read_db
+        shop_app.drain_pool()
+    print(f"{len(checked)} statements checked, {failures} regressions")
+    return 1 if failures else 0
+
+# Median wall time in milliseconds of fetching every row of sql
+def time_query(conn, sql, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+# First page of /products search results: the old LIKE scan against the FTS5 index
+SEARCH_QUERIES = {
+    'like': ('''SELECT p.PID, p.Price, p.Name, p.Category FROM Product p
+                WHERE p.Name LIKE ? OR p.Category LIKE ? ORDER BY p.PID LIMIT 51''',
+             lambda term: (f'%{term}%', f'%{term}%')),
+    'fts': ('''SELECT p.PID, p.Price, p.Name, p.Category FROM ProductSearch ps
+               JOIN Product p ON p.PID = ps.rowid
+               WHERE ProductSearch MATCH ? ORDER BY ps.rank, p.PID LIMIT 51''',
+            lambda term: (shop_app.fts_query(term),)),
+}
+SEARCH_TERMS = ['Lamp', 'Kett', 'Vintage Drone', '98765']
+
+def benchmark_search(args):
+    print(f"{'products':>10} {'term':>15} {'matches':>9} {'like ms':>10} {'fts ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            load_synthetic_db(workdir, products=size, customers=10, vendors=max(size // 100, 1), purchases=0)
+            conn = shop_app.connect_db()
+            for term in SEARCH_TERMS:
+                results = {}
+                for name, (sql, params) in SEARCH_QUERIES.items():
+                    results[name] = time_query(conn, sql, params(term), args.repeat)
+                matches = conn.execute("SELECT COUNT(*) FROM ProductSearch WHERE ProductSearch MATCH ?",
+                                       (shop_app.fts_query(term),)).fetchone()[0]
+                print(f"{size:>10} {term:>15} {matches:>9} {results['like']:>10.2f} {results['fts']:>10.2f} "
+                      f"{results['like'] / results['fts']:>7.1f}x")
+            conn.close()
+    return 0
+
+# One session against the app, through Flask's test client or over HTTP to a running server
+class TestClientSession:
+    def __init__(self, base_url=None):
+        self.client = shop_app.app.test_client()
+
+    def request(self, method, path, form=None):
+        return self.client.open(path, method=method, data=form).status_code
+
+class HTTPSession:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, form=None):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        try:
+            with self.opener.open(urllib.request.Request(self.base_url + path, data=data, method=method)) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+# The mixed workload: each operation builds one request for a customer or admin session
+WORKLOAD = {
+    'browse': ('customer', lambda rng, scale: (
+        'GET', f"/shop?after={rng.randint(0, scale['products'])}"
+               + (f"&category={urllib.parse.quote(rng.choice(CATEGORIES))}" if rng.random() < 0.3 else ''), None)),
+    'buy': ('customer', lambda rng, scale: (
+        'POST', '/shop', {'pid': rng.choices(scale['popularity'], cum_weights=scale['weights'])[0], 'buy': 'Buy'})),
+    'search': ('admin', lambda rng, scale: (
+        'GET', f"/products?search={rng.choice(NOUNS)[:rng.randint(3, 5)]}", None)),
+    'vendor_performance': ('admin', lambda rng, scale: (
+        'POST', '/vendors', {'vid': rng.randint(1, scale['vendors']), 'view_performance': 'View Performance'})),
+    'recommend': ('admin', lambda rng, scale: (
+        'POST', '/discounts', {'cid': rng.randint(1, scale['customers']), 'recommend': 'Generate Recommendations'})),
+}
+DEFAULT_MIX = 'browse=50,buy=15,search=15,vendor_performance=10,recommend=10'
+
+# Nearest-rank percentile of a sorted list
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def run_workload(session_factory, args, scale, mix):
+    operations = list(mix)
+    weights = [mix[name] for name in operations]
+    samples = {name: [] for name in operations}
+    errors = {name: 0 for name in operations}
+    lock = threading.Lock()
+
+    def worker(number):
+        rng = random.Random(args.seed + number)
+        sessions = {'customer': session_factory(), 'admin': session_factory()}
+        cid = rng.randint(1, scale['customers'])
+        sessions['customer'].request('POST', '/', {'username': f'customer{cid}', 'password': '123', 'login': 'Login'})
+        sessions['admin'].request('POST', '/', {'username': 'admin', 'password': 'admin123', 'login': 'Login'})
+        for name in rng.choices(operations, weights=weights, k=args.requests):
+            role, build = WORKLOAD[name]
+            method, path, form = build(rng, scale)
+            started = time.perf_counter()
+            status = sessions[role].request(method, path, form)
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples[name].append(elapsed)
+                if status >= 400:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    results = {}
+    for name in operations:
+        timings = sorted(samples[name])
+        if not timings:
+            continue
+        results[name] = {
+            'requests': len(timings),
+            'errors': errors[name],
+            'requests_per_second': len(timings) / duration,
+            'p50_ms': percentile(timings, 0.50) * 1000,
+            'p95_ms': percentile(timings, 0.95) * 1000,
+            'p99_ms': percentile(timings, 0.99) * 1000,
+        }
+    total = sum(len(timings) for timings in samples.values())
+    return {'duration_seconds': duration, 'requests_per_second': total / duration, 'routes': results}
+
+def print_results(mode, results, baseline=None):
+    print(f"\n{mode}: {results['requests_per_second']:.1f} requests/sec over {results['duration_seconds']:.1f}s")
+    print(f"{'operation':>20} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+          + (f" {'p95 vs baseline':>16}" if baseline else ''))
+    for name, route in results['routes'].items():
+        line = (f"{name:>20} {route['requests']:>9} {route['errors']:>7} {route['requests_per_second']:>8.1f} "
+                f"{route['p50_ms']:>8.2f} {route['p95_ms']:>8.2f} {route['p99_ms']:>8.2f}")
+        previous = (baseline or {}).get(mode, {}).get('routes', {}).get(name)
+        if previous:
+            line += f" {(route['p95_ms'] / previous['p95_ms'] - 1) * 100:>+15.1f}%"
+        print(line)
+
+# Serve asgi.application with uvicorn on a background thread. The database is already loaded,
+# so the app's startup hook (which would reload it) is skipped.
+def start_asgi_server():
+    import uvicorn
+    import asgi
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(asgi.application, host='127.0.0.1', port=port,
+                                           lifespan='off', log_level='error'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f'http://127.0.0.1:{port}'
+
+def benchmark_load(args):
+    mix = {}
+    for item in args.mix.split(','):
+        name, weight = item.split('=')
+        if name not in WORKLOAD:
+            raise SystemExit(f"Unknown operation {name!r}; choose from {', '.join(WORKLOAD)}")
+        mix[name] = float(weight)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    report = {'config': vars(args).copy(), 'results': {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        load_synthetic_db(workdir, products=args.products, customers=args.customers, vendors=args.vendors,
+                          purchases=args.purchases, skew=args.skew, seed=args.seed)
+        popularity = list(range(1, args.products + 1))
+        random.Random(args.seed).shuffle(popularity)
+        scale = {'products': args.products, 'customers': args.customers, 'vendors': args.vendors,
+                 'popularity': popularity, 'weights': zipf_weights(args.products, args.skew)}
+
+        if 'client' in args.modes:
+            report['results']['client'] = run_workload(TestClientSession, args, scale, mix)
+            print_results('client', report['results']['client'], baseline)
+        if 'server' in args.modes:
+            logging.getLogger('werkzeug').setLevel(logging.ERROR)
+            server = make_server('127.0.0.1', 0, shop_app.app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{server.server_port}'
+            report['results']['server'] = run_workload(lambda: HTTPSession(base_url), args, scale, mix)
+            server.shutdown()
+            print_results('server', report['results']['server'], baseline)
+        if 'asgi' in args.modes:
+            server, base_url = start_asgi_server()
+            report['results']['asgi'] = run_workload(lambda: HTTPSession(base_url), args, scale, mix)
+            server.should_exit = True
+            print_results('asgi', report['results']['asgi'], baseline)
+        shop_app.drain_pool()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+# Snapshot (sync_to_file) and restore (init_db load, without index builds) time for the text
+# and binary formats, on the same synthetic data set
+def benchmark_snapshot(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        load_synthetic_db(workdir, products=args.products, customers=args.customers, vendors=args.vendors,
+                          purchases=args.purchases, skew=args.skew, seed=args.seed)
+        print(f"{'format':>8} {'rows':>10} {'size MB':>8} {'snapshot s':>11} {'restore s':>10} {'rows/sec':>10}")
+        for label, name in (('text', 'snapshot.txt'), ('binary', 'snapshot.snap')):
+            path = os.path.join(workdir, name)
+            shop_app.app.config['DATA_FILE'] = path
+            started = time.perf_counter()
+            shop_app.sync_to_file()
+            snapshot_seconds = time.perf_counter() - started
+            stats = shop_app.init_db()
+            print(f"{label:>8} {stats['rows']:>10} {os.path.getsize(path) / 1e6:>8.1f} {snapshot_seconds:>11.2f} "
+                  f"{stats['load_seconds']:>10.2f} {stats['rows_per_second']:>10.0f}")
+        shop_app.drain_pool()
+    return 0
+
+# Cold start (rebuild database.db from the snapshot) versus warm start (reuse it) on the same
+# synthetic data set, with the time spent in each startup phase
+def benchmark_startup(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        load_synthetic_db(workdir, products=args.products, customers=args.customers, vendors=args.vendors,
+                          purchases=args.purchases, skew=args.skew, seed=args.seed)
+        print(f"{'start':>6} {'total s':>8}  phases")
+        for label, warm in (('cold', False), ('warm', True)):
+            started = time.perf_counter()
+            stats = shop_app.init_db(warm=warm)
+            total = time.perf_counter() - started
+            print(f"{label:>6} {total:>8.3f}  {shop_app.format_timings(stats['timings'])}")
+        shop_app.drain_pool()
+    return 0
+
+# Login throughput for each password hashing pool size while client threads log in concurrently.
+# A customer browsing /shop at the same time shows whether the logins starve other requests.
+def benchmark_login(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        load_synthetic_db(workdir, products=1000, customers=max(args.threads, 10), vendors=10, purchases=5)
+        shop_app.app.config.update(LOGIN_THROTTLE={}, PASSWORD_HASH_ITERATIONS=args.iterations)
+        usernames = [f'customer{n}' for n in range(1, args.threads + 1)]
+        client = shop_app.app.test_client()
+        for username in usernames:
+            login(client, username, '123')  # Hash the plaintext passwords before measuring
+        print(f"PBKDF2-SHA256 with {args.iterations} iterations, {args.threads} client threads")
+        print(f"{'workers':>8} {'logins/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'rejected':>9} {'shop p95 ms':>12}")
+        for workers in args.workers:
+            shop_app.app.config['PASSWORD_HASH_WORKERS'] = workers
+            shop_app._hash_executor = None
+            timings = []
+            shop_timings = []
+            rejected = 0
+            lock = threading.Lock()
+            done = threading.Event()
+
+            def log_in(username):
+                nonlocal rejected
+                session = shop_app.app.test_client()
+                for _ in range(args.logins):
+                    started = time.perf_counter()
+                    status = session.post('/', data={'username': username, 'password': '123', 'login': 'Login'}).status_code
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        timings.append(elapsed)
+                        rejected += status == 503
+
+            def browse():
+                session = shop_app.app.test_client()
+                login(session, usernames[0], '123')
+                while not done.is_set():
+                    started = time.perf_counter()
+                    session.get('/shop')
+                    shop_timings.append(time.perf_counter() - started)
+
+            browser = threading.Thread(target=browse)
+            browser.start()
+            threads = [threading.Thread(target=log_in, args=(username,)) for username in usernames]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duration = time.perf_counter() - started
+            done.set()
+            browser.join()
+            timings.sort()
+            shop_timings.sort()
+            print(f"{workers:>8} {len(timings) / duration:>9.1f} {percentile(timings, 0.5) * 1000:>8.1f} "
+                  f"{percentile(timings, 0.95) * 1000:>8.1f} {rejected:>9} "
+                  f"{percentile(shop_timings, 0.95) * 1000 if shop_timings else 0:>12.1f}")
+        shop_app.drain_pool()
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="eCommerce Simulator performance tooling")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="write a synthetic sample_data.txt")
+    generate.add_argument('path')
+
+    plans = commands.add_parser('plans', help="fail if a hot query falls back to a full table scan")
+    plans.add_argument('--verbose', action='store_true')
+
+    search = commands.add_parser('search', help="compare LIKE and full-text product search latency")
+    search.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    search.add_argument('--repeat', type=int, default=20)
+
+    load = commands.add_parser('load', help="drive a mixed workload and report latency per operation")
+    load.add_argument('--modes', nargs='+', choices=['client', 'server', 'asgi'], default=['client', 'server'],
+                      help="Flask test client in-process, HTTP against a threaded local server, "
+                           "and/or HTTP against asgi.py under uvicorn")
+    load.add_argument('--threads', type=int, default=8)
+    load.add_argument('--requests', type=int, default=200, help="requests per thread")
+    load.add_argument('--mix', default=DEFAULT_MIX, help="operation weights, e.g. " + DEFAULT_MIX)
+    load.add_argument('--output', help="write the results as JSON to this file")
+    load.add_argument('--baseline', help="JSON results of an earlier run to compare p95 latency with")
+
+    logins = commands.add_parser('login', help="login throughput under concurrent clients per hashing pool size")
+    logins.add_argument('--threads', type=int, default=16)
+    logins.add_argument('--logins', type=int, default=10, help="logins per thread")
+    logins.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    logins.add_argument('--iterations', type=int, default=shop_app.app.config['PASSWORD_HASH_ITERATIONS'])
+
+    snapshot = commands.add_parser('snapshot', help="compare text and binary snapshot and restore time")
+    startup = commands.add_parser('startup', help="compare cold and warm start time by phase")
+
+    for command in (generate, plans, load, snapshot, startup):
+        command.add_argument('--products', type=int, default=20000)
+        command.add_argument('--customers', type=int, default=2000)
+        command.add_argument('--vendors', type=int, default=200)
+        command.add_argument('--purchases', type=int, default=25, help="average purchases per customer")
+        command.add_argument('--skew', type=float, default=1.0, help="Zipf exponent for categories and purchases")
+        command.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args(argv)
+    if args.command == 'generate':
+        generate_sample_data(args.path, products=args.products, customers=args.customers, vendors=args.vendors,
+                             purchases=args.purchases, skew=args.skew, seed=args.seed)
+        return 0
+    if args.command == 'search':
+        return benchmark_search(args)
+    if args.command == 'load':
+        return benchmark_load(args)
+    if args.command == 'snapshot':
+        return benchmark_snapshot(args)
+    if args.command == 'login':
+        return benchmark_login(args)
+    if args.command == 'startup':
+        return benchmark_startup(args)
+    return check_plans(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,20 @@
+# Product pricing for customers. A customer's discount on a category is the best percentage among
+# their Discount rows for it, kept in the CategoryDiscount table (one row per (CID, Category),
+# maintained by triggers on Discount), so pricing a product is one primary-key lookup and a
+# product matches at most one discount.
+
+# Price after a percentage discount; no discount leaves the price as it is
+def final_price(price, percentage):
+    return price * (1 - percentage / 100) if percentage else price
+
+# Price the products in pids for a customer with one query. Returns {pid: (price, percentage,
+# final_price)} for the pids that exist; percentage is None where the customer has no discount.
+def price_many(c, cid, pids):
+    pids = list(pids)
+    if not pids:
+        return {}
+    c.execute(f'''SELECT p.PID, p.Price, cd.Percentage
+                  FROM Product p
+                  LEFT JOIN CategoryDiscount cd ON cd.CID = ? AND cd.Category = p.Category
+                  WHERE p.PID IN ({', '.join('?' * len(pids))})''', [cid] + pids)
+    return {pid: (price, percentage, final_price(price, percentage)) for pid, price, percentage in c.fetchall()}
@@ -0,0 +1,203 @@
+# Binary columnar snapshot of the database tables, an alternative to the sample_data.txt text
+# format. Keys and every column are stored exactly, so names containing commas or '#' survive.
+#
+# Layout (little-endian):
+#   header     magic, format version, table count, directory offset, CRC32 of everything after
+#              the header
+#   columns    one block per column, each 8-byte aligned: integer columns are packed arrays of
+#              the narrowest signed width (1-8 bytes) that holds their values, real columns are
+#              float64 arrays, and text columns are a UTF-8 blob plus int64 character offsets
+#              (rows + 1 of them); nullable columns also have one validity byte per row
+#   directory  JSON list of tables with their row counts and the offsets of each column's blocks
+#
+# Run `python snapshot.py convert <source> <target>` to convert between the text and binary
+# formats; files ending in .snap are binary.
+import argparse
+import array
+import itertools
+import json
+import mmap
+import operator
+import os
+import struct
+import sys
+import tempfile
+import zlib
+
+MAGIC = b'ECSNAP\r\n'
+VERSION = 1
+SUFFIX = '.snap'
+HEADER = struct.Struct('<8sHHIQII')
+INTEGER_CODES = ('b', 'h', 'i', 'q')
+
+def is_snapshot_path(path):
+    return path.endswith(SUFFIX)
+
+# Pick the storage type of a column from its values: int64 if every value is an integer, float64
+# if every value is a number, text otherwise
+def column_type(values):
+    kinds = set(map(type, values)) - {type(None)}
+    if kinds <= {int}:
+        return 'integer'
+    if kinds <= {int, float}:
+        return 'real'
+    return 'text'
+
+# Narrowest array type code that holds every integer in values
+def integer_code(values):
+    low, high = (min(values), max(values)) if values else (0, 0)
+    for code in INTEGER_CODES:
+        bits = array.array(code).itemsize * 8
+        if -(1 << (bits - 1)) <= low and high < 1 << (bits - 1):
+            return code
+    raise OverflowError("integer column doesn't fit in 64 bits")
+
+class SnapshotWriter:
+    def __init__(self, f):
+        self.f = f
+        self.offset = HEADER.size
+        self.checksum = 0
+        f.write(b'\0' * HEADER.size)
+
+    def write(self, data):
+        self.f.write(data)
+        self.checksum = zlib.crc32(data, self.checksum)
+        self.offset += len(data)
+
+    # Write one block, padded to 8 bytes; returns its offset
+    def block(self, data):
+        offset = self.offset
+        self.write(data)
+        if len(data) % 8:
+            self.write(b'\0' * (8 - len(data) % 8))
+        return offset
+
+    def column(self, name, values):
+        kind = column_type(values)
+        entry = {'name': name, 'type': kind, 'valid': None}
+        if None in values:
+            entry['valid'] = self.block(bytes(value is not None for value in values))
+            values = [(0 if kind == 'integer' else 0.0) if value is None else value for value in values]
+        if kind == 'integer':
+            entry['code'] = integer_code(values)
+            entry['data'] = self.block(array.array(entry['code'], values).tobytes())
+        elif kind == 'real':
+            entry['data'] = self.block(array.array('d', values).tobytes())
+        else:
+            strings = ['' if value is None else str(value) for value in values]
+            entry['offsets'] = self.block(array.array('q', itertools.accumulate(map(len, strings), initial=0)).tobytes())
+            blob = ''.join(strings).encode('utf-8')
+            entry['data'] = self.block(blob)
+            entry['size'] = len(blob)
+        return entry
+
+    def finish(self, directory):
+        directory_offset = self.offset
+        self.write(json.dumps(directory).encode('utf-8'))
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, VERSION, len(directory), 0, directory_offset, self.checksum, 0))
+
+# Write every row of the given tables, in rowid order, to a snapshot file at path. Callers read
+# inside one transaction to get a consistent snapshot.
+def write_snapshot(conn, path, tables):
+    directory = []
+    with open(path, 'wb') as f:
+        writer = SnapshotWriter(f)
+        c = conn.cursor()
+        for table in tables:
+            c.execute(f"SELECT * FROM {table}")
+            names = [column[0] for column in c.description]
+            rows = c.fetchall()
+            directory.append({'name': table, 'rows': len(rows),
+                              'columns': [writer.column(name, list(map(operator.itemgetter(i), rows)))
+                                          for i, name in enumerate(names)]})
+            del rows
+        writer.finish(directory)
+
+# Memory-mapped reader. Columns are decoded straight from the mapped file into lists.
+class Snapshot:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            self.file.close()
+            raise ValueError(f"{path} is not a snapshot file")
+        if len(self.map) < HEADER.size or self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a snapshot file")
+        _, version, _, _, directory_offset, self.checksum, _ = HEADER.unpack_from(self.map)
+        if version > VERSION:
+            self.close()
+            raise ValueError(f"{path} uses snapshot format {version}; this version reads up to {VERSION}")
+        try:
+            self.tables = {table['name']: table for table in json.loads(self.map[directory_offset:])}
+        except ValueError:
+            self.close()
+            raise ValueError(f"{path} is truncated or corrupt: its table directory can't be read") from None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    # True if the data matches the checksum recorded in the header
+    def verify(self):
+        with memoryview(self.map) as view:
+            return zlib.crc32(view[HEADER.size:]) == self.checksum
+
+    def columns(self, table):
+        return [column['name'] for column in self.tables[table]['columns']]
+
+    def column(self, table, name):
+        info = self.tables[table]
+        rows = info['rows']
+        column = next(column for column in info['columns'] if column['name'] == name)
+        with memoryview(self.map) as view:
+            if column['type'] == 'text':
+                with view[column['offsets']:column['offsets'] + 8 * (rows + 1)].cast('q') as offsets:
+                    bounds = offsets.tolist()
+                text = str(view[column['data']:column['data'] + column['size']], 'utf-8')
+                values = [text[start:end] for start, end in zip(bounds, bounds[1:])]
+            else:
+                code = column.get('code', 'd')
+                size = array.array(code).itemsize * rows
+                with view[column['data']:column['data'] + size].cast(code) as data:
+                    values = data.tolist()
+            if column['valid'] is not None:
+                valid = view[column['valid']:column['valid'] + rows]
+                values = [value if present else None for value, present in zip(values, valid)]
+                valid.release()
+        return values
+
+    # Rows of table as tuples of the given columns (all of them by default)
+    def rows(self, table, columns=None):
+        return zip(*(self.column(table, name) for name in columns or self.columns(table)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert between sample_data.txt and binary snapshots")
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('convert', help="convert a data file; files ending in .snap are binary")
+    convert.add_argument('source')
+    convert.add_argument('target')
+    args = parser.parse_args(argv)
+
+    import app as shop_app  # app.py imports this module, so load it only for the converter
+    with tempfile.TemporaryDirectory() as workdir:
+        shop_app.app.config.update(DATABASE=os.path.join(workdir, 'convert.db'), DATA_FILE=args.source,
+                                   JOURNAL_FILE=os.path.join(workdir, 'convert.journal'))
+        stats = shop_app.init_db()
+        shop_app.app.config['DATA_FILE'] = args.target
+        shop_app.sync_to_file()
+        shop_app.drain_pool()
+    print(f"Converted {stats['rows']} rows from {args.source} to {args.target}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as shop_app
+
+# A small store: Alice has bought five products (enough for a rewards tier), Bob two
+SAMPLE_DATA = """# Sample data for e-commerce database
+
+PRODUCTS
+20.0,Lamp,Home Decor
+15.0,Novel,Books
+5.0,Pen,Stationery
+12.0,Atlas,Books
+30.0,Rug,Home Decor
+2.5,Pencil,Stationery
+45.0,Chair,Furniture
+9.0,Poster,Home Decor
+
+CUSTOMERS
+Alice
+Bob
+
+VENDORS
+Acme
+Globex
+
+BUYS
+1,1,0,20.0,,20.0,1767229200,1
+1,2,0,15.0,,15.0,1767232800,1
+1,3,0,5.0,,5.0,1767315600,3
+1,4,0,12.0,,12.0,1767319200,1
+1,6,0,2.5,,2.5,1767402000,2
+2,1,0,18.0,,18.0,1767232800,2
+2,5,0,30.0,,30.0,1767405600,1
+
+SUPPLIES
+1,1
+1,2
+1,3
+2,4
+2,5
+2,6
+2,7
+
+DISCOUNTS
+
+USERS
+admin,admin123,Admin,NULL
+alice,123,Customer,Alice
+bob,123,Customer,Bob
+"""
+
+# Point app.py at files in a fresh temporary directory, and restore its settings afterwards.
+# In-process caches and login throttles are cleared so no test sees another's state.
+@pytest.fixture
+def workdir(tmp_path):
+    config = dict(shop_app.app.config)
+    shop_app.app.config.update(
+        DATABASE=str(tmp_path / 'database.db'),
+        DATA_FILE=str(tmp_path / 'sample_data.txt'),
+        JOURNAL_FILE=str(tmp_path / 'sample_data.journal'),
+        ANALYTICS_DATABASE=str(tmp_path / 'database.snapshot.db'),
+        PASSWORD_HASH_ITERATIONS=1000,
+    )
+    shop_app._shop_cache.clear()
+    shop_app._shop_cache_rows = 0
+    shop_app._vendor_stats = None
+    shop_app._login_buckets.clear()
+    yield tmp_path
+    shop_app.drain_pool()
+    shop_app.app.config.update(config)
+
+# The SAMPLE_DATA store, loaded into a fresh database
+@pytest.fixture
+def store(workdir):
+    (workdir / 'sample_data.txt').write_text(SAMPLE_DATA)
+    shop_app.init_db(warm=False)
+    return workdir
+
+@pytest.fixture
+def client(store):
+    return shop_app.app.test_client()
+
+def log_in(client, username, password):
+    client.get('/logout')
+    return client.post('/', data={'username': username, 'password': password, 'login': 'Login'})
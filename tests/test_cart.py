@@ -0,0 +1,33 @@
+import app as shop_app
+import pricing
+from conftest import log_in
+
+def test_cart_and_checkout_use_customer_prices(client):
+    log_in(client, 'admin', 'admin123')
+    client.post('/discounts', data={'add_discount': 'Add Discount', 'cid': 1, 'category': 'Home Decor'})
+    log_in(client, 'alice', '123')
+    pids = [5, 7, 8]
+    for pid in pids:
+        client.post('/shop', data={'pid': pid, 'add_to_cart': 'Add to Cart'})
+
+    conn = shop_app.connect_db()
+    prices = pricing.price_many(conn.cursor(), 1, pids)
+    assert prices[5] == (30.0, 15.0, 25.5) and prices[7] == (45.0, None, 45.0)
+    page = client.get('/cart').get_data(as_text=True)
+    for pid in pids:
+        assert f"${prices[pid][2]:.2f}" in page
+    assert f"Total: ${sum(final for _, _, final in prices.values()):.2f}" in page
+
+    page = client.post('/cart', data={'checkout': 'Checkout'}).get_data(as_text=True)
+    assert 'Checked out 3 items.' in page and 'Your cart is empty.' in page
+    rows = conn.execute("SELECT PID, UnitPrice, DiscountPercentage, FinalPrice FROM Buys "
+                        "WHERE CID = 1 AND PID IN (5, 7, 8) ORDER BY PID").fetchall()
+    conn.close()
+    assert rows == [(pid, *prices[pid]) for pid in pids]
+
+def test_checkout_skips_products_already_owned(client):
+    log_in(client, 'alice', '123')
+    client.post('/shop', data={'pid': 7, 'add_to_cart': 'Add to Cart'})
+    client.post('/shop', data={'pid': 7, 'buy': 'Buy'})
+    page = client.post('/cart', data={'checkout': 'Checkout'}).get_data(as_text=True)
+    assert 'Checked out 0 items.' in page
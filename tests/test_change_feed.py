@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+import app as shop_app
+from conftest import log_in
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Another worker process serving the same database changes a price through the admin page
+OTHER_WORKER = '''
+import sys
+import app as shop_app
+database, data_file, journal = sys.argv[1:]
+shop_app.app.config.update(DATABASE=database, DATA_FILE=data_file, JOURNAL_FILE=journal, CHANGE_FEED=True,
+                           PASSWORD_HASH_ITERATIONS=1000)
+client = shop_app.app.test_client()
+client.post('/', data={'username': 'admin', 'password': 'admin123', 'login': 'Login'})
+assert client.post('/products', data={'update': 'Update Price', 'pid': 5, 'price': '99.0'}).status_code == 200
+'''
+
+def run_other_worker():
+    config = shop_app.app.config
+    subprocess.run([sys.executable, '-c', OTHER_WORKER, config['DATABASE'], config['DATA_FILE'],
+                    config['JOURNAL_FILE']], cwd=ROOT, check=True)
+
+def test_changes_from_another_process_invalidate_caches(client):
+    shop_app.app.config['CHANGE_FEED'] = True
+    log_in(client, 'alice', '123')
+    assert '$30.00' in client.get('/shop').get_data(as_text=True)
+    assert 1 in shop_app._shop_cache
+
+    run_other_worker()
+    page = client.get('/shop').get_data(as_text=True)
+    assert '$99.00' in page and '$30.00' not in page
+
+# Control for the test above: with CHANGE_FEED off this process keeps serving its cached page
+def test_without_change_feed_other_processes_go_unseen(client):
+    log_in(client, 'alice', '123')
+    client.get('/shop')
+    run_other_worker()
+    assert '$30.00' in client.get('/shop').get_data(as_text=True)
@@ -0,0 +1,65 @@
+import io
+import json
+import sqlite3
+
+import app as shop_app
+from conftest import log_in
+
+PRODUCTS_CSV = '''price,name,category
+1.5,"Nuts, Bolts",Tools
+2.0,Gear #5,Tools
+3.25,Spanner,Tools
+abc,Wrench,Tools
+'''
+
+def import_file(client, kind, data, filename):
+    response = client.post(f'/import?kind={kind}', data={'file': (io.BytesIO(data.encode()), filename)})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+def product_names():
+    conn = shop_app.connect_db()
+    try:
+        return [row[0] for row in conn.execute("SELECT Name FROM Product WHERE Category = 'Tools' ORDER BY PID")]
+    finally:
+        conn.close()
+
+def test_text_snapshot_refuses_reserved_characters(client, store):
+    log_in(client, 'admin', 'admin123')
+    chunk, summary = import_file(client, 'products', PRODUCTS_CSV, 'products.csv')
+    assert summary == {'done': True, 'imported': 1, 'rejected': 3}
+    assert [error['line'] for error in chunk['errors']] == [2, 3, 5]
+    assert "'Nuts, Bolts'" in chunk['errors'][0]['error']
+
+    vendors = '{"name": "Acme # 2"}\n{"name": "Initech"}\n{"nme": "Typo"}\n'
+    chunk, summary = import_file(client, 'vendors', vendors, 'vendors.ndjson')
+    assert summary['imported'] == 1 and [error['line'] for error in chunk['errors']] == [1, 3]
+
+    # Import, compact into sample_data.txt, then rebuild from it
+    shop_app.compact_journal()
+    shop_app.init_db(warm=False)
+    assert product_names() == ['Spanner']
+
+def test_binary_snapshot_keeps_any_name(client, store):
+    shop_app.app.config['DATA_FILE'] = str(store / 'sample_data.snap')
+    shop_app.sync_to_file()
+    log_in(client, 'admin', 'admin123')
+    _, summary = import_file(client, 'products', PRODUCTS_CSV, 'products.csv')
+    assert summary['imported'] == 3
+    shop_app.compact_journal()
+    shop_app.init_db(warm=False)
+    assert product_names() == ['Nuts, Bolts', 'Gear #5', 'Spanner']
+
+def test_locked_database_is_reported_per_chunk(client, store):
+    log_in(client, 'admin', 'admin123')
+    shop_app.app.config['DB_BUSY_TIMEOUT'] = 50
+    shop_app.drain_pool()
+    other = sqlite3.connect(shop_app.app.config['DATABASE'], isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        chunk, summary = import_file(client, 'products', PRODUCTS_CSV, 'products.csv')
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+    assert chunk['imported'] == 0 and 'database is locked' in chunk['errors'][-1]['error']
+    assert summary == {'done': True, 'imported': 0, 'rejected': 4}
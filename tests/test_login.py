@@ -0,0 +1,31 @@
+import app as shop_app
+from conftest import log_in
+
+def test_repeated_failures_are_throttled(client):
+    burst = shop_app.app.config['LOGIN_THROTTLE']['user'][0]
+    for _ in range(burst):
+        response = log_in(client, 'alice', 'wrong')
+        assert response.status_code == 200 and b'Invalid credentials' in response.data
+    assert log_in(client, 'alice', 'wrong').status_code == 429
+    assert log_in(client, 'alice', '123').status_code == 429
+    assert log_in(client, 'bob', '123').status_code == 302
+
+def test_unknown_user_fails(client):
+    response = log_in(client, 'nobody', '123')
+    assert response.status_code == 200 and b'Invalid credentials' in response.data
+
+def test_malformed_hash_fails_without_error(client):
+    conn = shop_app.connect_db()
+    conn.execute("UPDATE Users SET Password = 'pbkdf2_sha256$many$00$00' WHERE Username = 'bob'")
+    conn.commit()
+    conn.close()
+    response = log_in(client, 'bob', '123')
+    assert response.status_code == 200 and b'Invalid credentials' in response.data
+
+def test_plaintext_password_is_hashed_on_login(client):
+    assert log_in(client, 'alice', '123').status_code == 302
+    conn = shop_app.connect_db()
+    stored = conn.execute("SELECT Password FROM Users WHERE Username = 'alice'").fetchone()[0]
+    conn.close()
+    assert stored.startswith(shop_app.PASSWORD_SCHEME + '$')
+    assert log_in(client, 'alice', '123').status_code == 302
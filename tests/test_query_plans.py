@@ -0,0 +1,13 @@
+import argparse
+
+import benchmark
+
+# Every query the app runs against a small synthetic database must use an index, except for the
+# full reads each scenario in benchmark.PLAN_SCENARIOS allows
+def test_no_full_scans(workdir, capsys):
+    args = argparse.Namespace(products=2000, customers=200, vendors=20, purchases=10, skew=1.0, seed=0,
+                              verbose=False)
+    status = benchmark.check_plans(args)
+    output = capsys.readouterr().out
+    assert status == 0, output
+    assert ' 0 regressions' in output
@@ -0,0 +1,65 @@
+import pytest
+
+import app as shop_app
+from conftest import log_in
+
+# Each rollup recomputed straight from Buys: (key expression, join for the key)
+DIRECT = {
+    'ProductSales': ('b.PID', ''),
+    'CategorySales': ("COALESCE(p.Category, '')", 'JOIN Product p ON p.PID = b.PID'),
+    'VendorSales': ('s.VID', 'JOIN Supplies s ON s.PID = b.PID'),
+}
+
+def rollup_rows(conn, table):
+    key = shop_app.SALES_ROLLUPS[table][0]
+    return conn.execute(f'''SELECT Period, Start, {key}, Orders, Units, ROUND(Revenue, 6) FROM {table}
+                            WHERE Orders > 0 ORDER BY 1, 2, 3''').fetchall()
+
+def direct_rows(conn, table):
+    expression, join = DIRECT[table]
+    return conn.execute(f'''SELECT w.Period, b.PurchasedAt - b.PurchasedAt % w.Width, {expression},
+                                   COUNT(*), SUM(b.Quantity), ROUND(SUM(b.FinalPrice * b.Quantity), 6)
+                            FROM Buys b {join}, {shop_app.SALES_PERIODS}
+                            WHERE b.PurchasedAt IS NOT NULL
+                            GROUP BY 1, 2, 3 ORDER BY 1, 2, 3''').fetchall()
+
+def assert_rollups_match():
+    conn = shop_app.connect_db()
+    try:
+        for table in DIRECT:
+            assert rollup_rows(conn, table) == direct_rows(conn, table), table
+    finally:
+        conn.close()
+
+def test_rollups_match_buys(client):
+    assert_rollups_match()
+    conn = shop_app.connect_db()
+    assert conn.execute("SELECT Orders, Units, Revenue FROM ProductSales WHERE Period = 'day' AND PID = 3").fetchall() \
+        == [(1, 3, 15.0)]
+    conn.close()
+
+    log_in(client, 'bob', '123')
+    for pid in (2, 4, 7):
+        client.post('/shop', data={'pid': pid, 'add_to_cart': 'Add to Cart'})
+    client.post('/cart', data={'checkout': 'Checkout'})
+    assert_rollups_match()
+
+    conn = shop_app.connect_db()
+    conn.execute("DELETE FROM Buys WHERE CID = 1 AND PID = 6")
+    conn.commit()
+    conn.close()
+    assert_rollups_match()
+
+    shop_app.init_db(warm=False)
+    assert_rollups_match()
+
+@pytest.mark.parametrize('query, summary', [
+    ('?from=2026-01-01&to=2026-01-03', '7 order(s), 11 unit(s), $133.00 revenue'),
+    ('?from=2026-01-02&to=2026-01-02', '2 order(s), 4 unit(s), $27.00 revenue'),
+    ('?period=hour&from=2026-01-01&to=2026-01-01', '3 order(s), 4 unit(s), $71.00 revenue'),
+])
+def test_reports_page_totals(client, query, summary):
+    log_in(client, 'admin', 'admin123')
+    response = client.get('/reports' + query)
+    assert response.status_code == 200
+    assert summary in response.get_data(as_text=True)
@@ -0,0 +1,33 @@
+import app as shop_app
+from conftest import log_in
+
+def cache_hits():
+    return shop_app._counters.get(('shop_cache_hits_total', 'shop'), 0)
+
+def test_discount_change_refreshes_cached_pages(client):
+    log_in(client, 'alice', '123')
+    page = client.get('/shop').get_data(as_text=True)
+    assert '$30.00' in page and '$25.50' not in page
+    hits = cache_hits()
+    assert client.get('/shop').get_data(as_text=True) == page
+    assert cache_hits() == hits + 1
+
+    log_in(client, 'admin', 'admin123')
+    client.post('/discounts', data={'add_discount': 'Add Discount', 'cid': 1, 'category': 'Home Decor'})
+    log_in(client, 'alice', '123')
+    page = client.get('/shop').get_data(as_text=True)
+    assert '15.0% OFF!' in page and '$25.50' in page
+
+    log_in(client, 'bob', '123')
+    assert '$25.50' not in client.get('/shop').get_data(as_text=True)
+
+def test_purchase_drops_only_that_customers_pages(client):
+    log_in(client, 'bob', '123')
+    client.get('/shop')
+    bob_pages = shop_app._shop_cache[2]
+    log_in(client, 'alice', '123')
+    client.get('/shop')
+    client.post('/shop', data={'pid': 7, 'buy': 'Buy'})
+    assert shop_app._shop_cache[2] is bob_pages
+    products, _ = next(iter(shop_app._shop_cache[1]['pages'].values()))
+    assert 7 not in [product[0] for product in products]